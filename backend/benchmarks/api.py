@@ -0,0 +1,205 @@
+"""Load test for the DPP API, driven in-process through the ASGI app.
+
+    python -m benchmarks.api --docs 10000 --requests 2000 --concurrency 32 --output bench.json
+    python -m benchmarks.api --compare bench.json
+
+Run from backend/. Without --mongo-uri an in-memory stand-in replaces the
+database, so runs work offline and numbers reflect the app itself. Output
+is JSON; --compare prints per-metric changes against an earlier run.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+
+import httpx
+
+import main
+from benchmarks.data import make_dpp, make_dpps
+from benchmarks.memory_db import MemoryDatabase
+from cache import LocalBackend, ResponseCache
+from database import ensure_indexes
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is KiB on Linux and bytes on macOS; this is the peak, not current.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+
+def summarize(durations, wall, rss_before, errors):
+    durations.sort()
+    ms = lambda s: round(s * 1000, 3)
+    return {
+        "requests": len(durations),
+        "errors": errors,
+        "throughput_rps": round(len(durations) / wall, 1) if wall else 0.0,
+        "p50_ms": ms(percentile(durations, 50)),
+        "p95_ms": ms(percentile(durations, 95)),
+        "p99_ms": ms(percentile(durations, 99)),
+        "rss_mb": round(rss_mb(), 1),
+        "rss_delta_mb": round(rss_mb() - rss_before, 1),
+    }
+
+
+async def drive(client, make_request, n, concurrency):
+    """Run ``n`` requests with ``concurrency`` workers; return (durations, wall seconds, errors)."""
+    durations = []
+    errors = 0
+    counter = iter(range(n))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            method, url, kwargs = make_request(i)
+            start = time.perf_counter()
+            resp = await client.request(method, url, **kwargs)
+            durations.append(time.perf_counter() - start)
+            if resp.status_code >= 400:
+                errors += 1
+
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return summarize(durations, time.perf_counter() - start, rss_before, errors)
+
+
+async def run(args):
+    if args.mongo_uri:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        client = AsyncIOMotorClient(args.mongo_uri)
+        # Counters and tombstones would otherwise carry over between runs.
+        await client.drop_database(args.db_name)
+        db = client[args.db_name]
+    else:
+        db = MemoryDatabase()
+    main.db = db
+    if args.no_cache:
+        main.dpp_cache = ResponseCache(LocalBackend(max_entries=0))
+
+    rng = random.Random(args.seed)
+    seed_docs = make_dpps(args.docs, args.seed)
+    started = time.perf_counter()
+    for i in range(0, len(seed_docs), 1000):
+        await db.dpps.insert_many(seed_docs[i:i + 1000])
+    seed_seconds = time.perf_counter() - started
+    # ASGITransport never sends lifespan events, so the app's startup hook
+    # does not run; build the indexes here, after the bulk load.
+    await ensure_indexes(db)
+    ids = [str(d["_id"]) for d in seed_docs]
+    categories = sorted({d["category"] for d in seed_docs})
+
+    results = {}
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        n, c = args.requests, args.concurrency
+        created = []
+
+        def create(i):
+            return "POST", "/dpp", {"json": make_dpp(rng, args.docs + i)}
+
+        results["create"] = await drive(client, create, n, c)
+        async for doc in db.dpps.find({"product_id": {"$gte": f"P-{args.docs:07d}"}}, {"_id": 1}):
+            created.append(str(doc["_id"]))
+
+        results["list"] = await drive(client, lambda i: ("GET", "/dpp", {"params": {"limit": 50}}), n, c)
+        results["list_filtered"] = await drive(
+            client, lambda i: ("GET", "/dpp", {"params": {"limit": 50, "category": categories[i % len(categories)]}}), n, c)
+        results["list_projected"] = await drive(
+            client, lambda i: ("GET", "/dpp", {"params": {"limit": 50, "fields": "product_id,supplier.name"}}), n, c)
+        results["get"] = await drive(client, lambda i: ("GET", f"/dpp/{rng.choice(ids)}", {}), n, c)
+        results["update"] = await drive(
+            client, lambda i: ("PUT", f"/dpp/{ids[i % len(ids)]}", {"json": make_dpp(rng, i)}), n, c)
+        results["delete"] = await drive(
+            client, lambda i: ("DELETE", f"/dpp/{created[i]}", {}), min(n, len(created)), c)
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "backend": "mongo" if args.mongo_uri else "memory",
+            "docs": args.docs,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "seed": args.seed,
+            "cache": not args.no_cache,
+            "seed_seconds": round(seed_seconds, 3),
+            "indexes": True,
+        },
+        "endpoints": results,
+        "cache": main.dpp_cache.stats(),
+    }
+
+
+def git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old, new, out=sys.stdout):
+    """Print every numeric metric present in both runs with its relative change."""
+    for section in ("endpoints", "micro"):
+        for name, metrics in new.get(section, {}).items():
+            before = old.get(section, {}).get(name, {})
+            for key, value in metrics.items():
+                prev = before.get(key)
+                if isinstance(value, (int, float)) and isinstance(prev, (int, float)) and prev:
+                    change = (value - prev) / prev * 100
+                    label = f"{section}.{name}.{key}"
+                    out.write(f"{label:<40} {prev:>12} -> {value:>12}  ({change:+.1f}%)\n")
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=10000, help="DPPs seeded before the run")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mongo-uri", help="benchmark against this Mongo instead of the in-memory stand-in")
+    parser.add_argument("--db-name", default="econetra_bench", help="database to use (and drop) with --mongo-uri")
+    parser.add_argument("--no-cache", action="store_true", help="disable the GET /dpp/{id} response cache")
+    parser.add_argument("--no-micro", action="store_true", help="skip the micro-benchmarks")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="earlier JSON output to compare against")
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run(args))
+    if not args.no_micro:
+        from benchmarks import micro
+        result["micro"] = micro.run()
+
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), result)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,72 @@
+"""Synthetic but realistic DPP documents for benchmarks."""
+import random
+
+CATEGORIES = ["Apparel", "Footwear", "Electronics", "Furniture", "Batteries", "Packaging"]
+MATERIALS = ["Organic cotton 95%, elastane 5%", "Recycled PET", "Bamboo", "Aluminium 6061", "Oak, linseed oil", "LiFePO4 cells"]
+SUPPLIERS = [
+    ("Acme Textiles Pvt Ltd", "Plot 12, MIDC, Pune, Maharashtra", "+91 20 5555 0101"),
+    ("Greenfield Components", "45 Industrial Area, Bengaluru, Karnataka", "sales@greenfield.example"),
+    ("Northwind Woodworks", "7 Sawmill Road, Jodhpur, Rajasthan", "+91 291 555 0199"),
+    ("Volt Cells Ltd", "Sector 63, Noida, Uttar Pradesh", "orders@voltcells.example"),
+]
+CERTIFICATIONS = ["GOTS", "OEKO-TEX 100", "FSC", "ISO 14001", "Fairtrade", "BIS", "CE", "RoHS"]
+COUNTRIES = ["India", "Bangladesh", "Vietnam", "Portugal", "Germany"]
+TRANSPORT = ["sea", "road", "rail", "air"]
+STATUSES = ["pending", "approved", "rejected"]
+
+
+def make_dpp(rng, i):
+    supplier = rng.choice(SUPPLIERS)
+    year = rng.randint(2022, 2025)
+    return {
+        "product_id": f"P-{i:07d}",
+        "product_name": f"{rng.choice(CATEGORIES)} item {i}",
+        "category": rng.choice(CATEGORIES),
+        "material_composition": rng.choice(MATERIALS),
+        "batch_number": f"B-{rng.randint(1, 5000):05d}",
+        "supplier": {"name": supplier[0], "address": supplier[1], "contact": supplier[2]},
+        "manufacture_date": f"{year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "expiry_date": f"{year + 5}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "certifications": rng.sample(CERTIFICATIONS, rng.randint(0, 3)),
+        "sustainability_score": round(rng.uniform(1, 10), 1),
+        "invoice_details": {
+            "invoice_number": f"INV-{year}/{rng.randint(1, 99999):05d}",
+            "invoice_date": f"{year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "quantity": rng.randint(1, 5000),
+            "price": round(rng.uniform(10, 100000), 2),
+            "currency": "INR",
+        },
+        "traceability": {
+            "origin_country": rng.choice(COUNTRIES),
+            "factory_location": supplier[1].split(", ")[-2],
+            "transport_mode": rng.choice(TRANSPORT),
+        },
+        "compliance_status": rng.choice(STATUSES),
+    }
+
+
+def make_dpps(n, seed=0):
+    rng = random.Random(seed)
+    return [make_dpp(rng, i) for i in range(n)]
+
+
+SAMPLE_OCR_TEXT = """ACME TEXTILES PVT LTD
+Plot 12, MIDC, Pune, Maharashtra
+GSTIN: 27AAACA1234A1Z5   Buyer GSTIN: 29BBBCB5678B1Z2
+TAX INVOICE
+Invoice No: INV-2024/00042      Invoice Date: 12/03/2024
+Batch No: B-07781   Mfg Date: 01-Feb-2024   Expiry: 2029-02-01
+Item: Organic cotton shirt   HSN 6205   Qty: 1,200   Rate: 120.00
+Sub Total: 1,44,000.00   CGST 2.5%: 3,600.00   SGST 2.5%: 3,600.00
+Grand Total: Rs. 1,51,200.00
+"""
+
+SAMPLE_LLM_REPLY = """Here is the JSON you asked for:
+{"product_id": null, "product_name": "Organic cotton shirt", "category": "Apparel",
+ "material_composition": "Organic cotton", "batch_number": "B-07781",
+ "supplier": {"name": "Acme Textiles Pvt Ltd", "address": "Plot 12, MIDC, Pune", "contact": null},
+ "manufacture_date": "2024-02-01", "expiry_date": "2029-02-01", "certifications": [],
+ "sustainability_score": null,
+ "invoice_details": {"invoice_number": "INV-2024/00042", "invoice_date": "2024-03-12", "quantity": 1200, "price": 151200.0, "currency": "INR"},
+ "traceability": {"origin_country": "India", "factory_location": "Pune", "transport_mode": null}}
+Let me know if you need anything else."""
@@ -0,0 +1,228 @@
+"""In-memory stand-in for the parts of a Motor database the API uses.
+
+Documents are round-tripped through BSON on the way in and out, like a real
+driver, but queries are evaluated in Python; latencies measured against it
+show the cost of the app, not of Mongo.
+"""
+import bson
+from bson.objectid import ObjectId
+from pymongo import ReturnDocument
+
+
+def _get(doc, path):
+    for part in path.split("."):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(part)
+    return doc
+
+
+def _set(doc, path, value):
+    *parents, last = path.split(".")
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    doc[last] = value
+
+
+OPERATORS = {
+    "$lt": lambda a, b: a is not None and a < b,
+    "$lte": lambda a, b: a is not None and a <= b,
+    "$gt": lambda a, b: a is not None and a > b,
+    "$gte": lambda a, b: a is not None and a >= b,
+    "$ne": lambda a, b: a != b,
+    "$in": lambda a, b: a in b,
+}
+
+
+def _eval(expr, doc):
+    """The aggregation expressions used in pipeline updates."""
+    if isinstance(expr, str) and expr.startswith("$"):
+        return _get(doc, expr[1:])
+    if isinstance(expr, list):
+        return [_eval(e, doc) for e in expr]
+    if isinstance(expr, dict):
+        if len(expr) == 1 and next(iter(expr)).startswith("$"):
+            op, args = next(iter(expr.items()))
+            args = [_eval(a, doc) for a in args]
+            if op == "$add":
+                return sum(args)
+            if op == "$ifNull":
+                return args[1] if args[0] is None else args[0]
+            if op == "$concatArrays":
+                return [item for arr in args for item in arr]
+            raise NotImplementedError(op)
+        return {k: _eval(v, doc) for k, v in expr.items()}
+    return expr
+
+
+def matches(doc, query):
+    for path, cond in query.items():
+        value = _get(doc, path)
+        if isinstance(cond, dict) and cond and all(k.startswith("$") for k in cond):
+            if not all(OPERATORS[op](value, arg) for op, arg in cond.items()):
+                return False
+        elif value != cond:
+            return False
+    return True
+
+
+def _copy(doc):
+    return bson.decode(bson.encode(doc))
+
+
+def _project(doc, projection):
+    if not projection:
+        return doc
+    out = {"_id": doc["_id"]}
+    for path, include in projection.items():
+        value = _get(doc, path)
+        if include and value is not None:
+            _set(out, path, value)
+    return out
+
+
+class Result:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class MemoryCursor:
+    def __init__(self, collection, query, projection):
+        self._collection = collection
+        self._query = query or {}
+        self._projection = projection
+        self._sort = None
+        self._limit = 0
+        self._iter = None
+
+    def sort(self, keys):
+        self._sort = keys
+        return self
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    def batch_size(self, n):
+        return self
+
+    def _results(self):
+        docs = self._collection.docs.values()
+        if self._sort == [("_id", -1)]:
+            # ObjectIds are inserted in increasing order.
+            docs = reversed(list(docs))
+        elif self._sort:
+            docs = list(docs)
+            for key, direction in reversed(self._sort):
+                docs.sort(key=lambda d: (_get(d, key) is not None, _get(d, key)), reverse=direction < 0)
+        count = 0
+        for doc in docs:
+            if matches(doc, self._query):
+                yield _project(_copy(doc), self._projection)
+                count += 1
+                if self._limit and count >= self._limit:
+                    return
+
+    def __aiter__(self):
+        self._iter = self._results()
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class MemoryCollection:
+    def __init__(self):
+        self.docs = {}
+
+    async def create_index(self, keys, **kwargs):
+        return "_".join(f"{k}_{d}" for k, d in keys)
+
+    async def insert_one(self, doc):
+        doc.setdefault("_id", ObjectId())
+        self.docs[doc["_id"]] = _copy(doc)
+        return Result(inserted_id=doc["_id"])
+
+    async def insert_many(self, docs, ordered=True):
+        for doc in docs:
+            doc.setdefault("_id", ObjectId())
+            self.docs[doc["_id"]] = _copy(doc)
+        return Result(inserted_ids=[d["_id"] for d in docs])
+
+    def find(self, query=None, projection=None):
+        return MemoryCursor(self, query, projection)
+
+    async def find_one(self, query=None, projection=None):
+        if query and set(query) == {"_id"} and not isinstance(query["_id"], dict):
+            doc = self.docs.get(query["_id"])
+            return _project(_copy(doc), projection) if doc else None
+        async for doc in self.find(query, projection).limit(1):
+            return doc
+        return None
+
+    def _find_raw(self, query):
+        if set(query) == {"_id"} and not isinstance(query["_id"], dict):
+            return self.docs.get(query["_id"])
+        return next((d for d in self.docs.values() if matches(d, query)), None)
+
+    def _apply(self, doc, update):
+        if isinstance(update, list):
+            for stage in update:
+                values = {path: _eval(expr, doc) for path, expr in stage["$set"].items()}
+                for path, value in values.items():
+                    _set(doc, path, value)
+            return
+        for path, value in update.get("$set", {}).items():
+            _set(doc, path, value)
+        for path, value in update.get("$inc", {}).items():
+            _set(doc, path, (_get(doc, path) or 0) + value)
+        for path, cond in update.get("$pull", {}).items():
+            items = _get(doc, path)
+            if isinstance(items, list):
+                _set(doc, path, [i for i in items if not (matches(i, cond) if isinstance(i, dict) else i == cond)])
+
+    async def update_one(self, query, update, upsert=False):
+        doc = self._find_raw(query)
+        if doc is None:
+            if upsert:
+                await self.find_one_and_update(query, update, upsert=True)
+            return Result(matched_count=0, modified_count=0)
+        self._apply(doc, update)
+        return Result(matched_count=1, modified_count=1)
+
+    async def find_one_and_update(self, query, update, projection=None, upsert=False,
+                                  return_document=ReturnDocument.BEFORE):
+        doc = self._find_raw(query)
+        before = _copy(doc) if doc else None
+        if doc is None:
+            if not upsert:
+                return None
+            doc = {k: v for k, v in query.items() if not isinstance(v, dict)}
+            doc.setdefault("_id", ObjectId())
+            self.docs[doc["_id"]] = doc
+        self._apply(doc, update)
+        result = _copy(doc) if return_document == ReturnDocument.AFTER else before
+        return _project(result, projection) if result else None
+
+    async def delete_one(self, query):
+        doc = self._find_raw(query)
+        if doc is None:
+            return Result(deleted_count=0)
+        del self.docs[doc["_id"]]
+        return Result(deleted_count=1)
+
+
+class MemoryDatabase:
+    def __init__(self):
+        self._collections = {}
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def __getitem__(self, name):
+        return self._collections.setdefault(name, MemoryCollection())
@@ -0,0 +1,211 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
+
+DPP_CACHE_MAX_ENTRIES = int(os.getenv("DPP_CACHE_MAX_ENTRIES", "10000"))
+DPP_CACHE_MAX_BYTES = int(os.getenv("DPP_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+DPP_CACHE_TTL = float(os.getenv("DPP_CACHE_TTL", "300"))
+DPP_CACHE_NEGATIVE_TTL = float(os.getenv("DPP_CACHE_NEGATIVE_TTL", "5"))
+# e.g. redis://localhost:6379/0; needed when running more than one worker,
+# otherwise each worker would keep serving bodies the others invalidated.
+DPP_CACHE_URL = os.getenv("DPP_CACHE_URL")
+
+
+# --- Backends ---
+# A backend stores opaque bytes under string keys with a TTL in seconds.
+# ``get`` also returns a generation that ``delete`` advances; ``set`` is
+# dropped if the generation moved on since, so a read that raced an update
+# cannot put the old value back.
+class LocalBackend:
+    """In-process LRU bounded by entry count and total value size.
+
+    Generations are kept per key, for the most recently invalidated
+    ``max_entries`` keys; when that table overflows it is cleared and an
+    epoch shared by all keys moves on instead. They only guard the process
+    they live in.
+    """
+
+    def __init__(self, max_entries=DPP_CACHE_MAX_ENTRIES, max_bytes=DPP_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.evictions = 0
+        self.epoch = 0
+        self._generations = {}
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def _generation(self, key):
+        return self.epoch, self._generations.get(key, 0)
+
+    async def get(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return None, self._generation(key)
+        expires, value = item
+        if expires < time.monotonic():
+            self._remove(key)
+            return None, self._generation(key)
+        self._data.move_to_end(key)
+        return value, self._generation(key)
+
+    async def set(self, key, value, ttl, generation):
+        if generation != self._generation(key):
+            return
+        if key in self._data:
+            self._remove(key)
+        if len(value) > self.max_bytes:
+            return
+        self._data[key] = (time.monotonic() + ttl, value)
+        self.size += len(value)
+        while len(self._data) > self.max_entries or self.size > self.max_bytes:
+            self._remove(next(iter(self._data)))
+            self.evictions += 1
+
+    async def delete(self, key):
+        self._generations[key] = self._generations.get(key, 0) + 1
+        if len(self._generations) > max(self.max_entries, 1):
+            self._generations.clear()
+            self.epoch += 1
+        if key in self._data:
+            self._remove(key)
+
+    def _remove(self, key):
+        _, value = self._data.pop(key)
+        self.size -= len(value)
+
+
+# Write the value only if the key's generation is still the one the reader saw.
+_SET_IF_CURRENT = """
+if (redis.call('GET', KEYS[2]) or '0') == ARGV[3] then
+    return redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+end
+return false
+"""
+
+
+class RedisBackend:
+    """Shared backend on Redis; needs the optional ``redis`` package.
+
+    Every key has its own generation counter, so the stale-write guard holds
+    across all workers sharing the server. Counters outlive the entries they
+    guard by ``generation_ttl`` seconds.
+    """
+
+    def __init__(self, url, prefix="dpp:", generation_ttl=3600):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("DPP_CACHE_URL is set but the 'redis' package is not installed")
+        self.prefix = prefix
+        self.generation_ttl = generation_ttl
+        self._redis = redis.from_url(url)
+        self._set_if_current = self._redis.register_script(_SET_IF_CURRENT)
+
+    def _keys(self, key):
+        return self.prefix + key, self.prefix + "gen:" + key
+
+    async def get(self, key):
+        value, generation = await self._redis.mget(*self._keys(key))
+        return value, int(generation or 0)
+
+    async def set(self, key, value, ttl, generation):
+        await self._set_if_current(keys=list(self._keys(key)), args=[value, int(ttl * 1000), generation])
+
+    async def delete(self, key):
+        value_key, generation_key = self._keys(key)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.delete(value_key)
+            pipe.incr(generation_key)
+            pipe.expire(generation_key, self.generation_ttl)
+            await pipe.execute()
+
+
+# --- Response cache ---
+class CachedResponse:
+    __slots__ = ("body", "etag")
+
+    def __init__(self, body, etag):
+        self.body = body
+        self.etag = etag
+
+    @property
+    def missing(self):
+        return self.body is None
+
+    @classmethod
+    def from_bytes(cls, raw):
+        # Stored as b"<etag> <body>"; an empty value is a cached 404.
+        if not raw:
+            return cls(None, None)
+        etag, _, body = raw.partition(b" ")
+        return cls(body, etag.decode())
+
+    def to_bytes(self):
+        if self.missing:
+            return b""
+        return self.etag.encode() + b" " + self.body
+
+
+def make_etag(body):
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+class ResponseCache:
+    """Serialized GET /dpp/{id} responses in a single backend.
+
+    With several workers the backend must be shared (Redis): a per-process
+    LRU in front of it would keep serving a body another worker has already
+    invalidated, so there is deliberately no local tier in that case.
+    """
+
+    def __init__(self, backend=None, ttl=DPP_CACHE_TTL, negative_ttl=DPP_CACHE_NEGATIVE_TTL):
+        self.backend = backend if backend is not None else LocalBackend()
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.invalidations = 0
+
+    async def get(self, key):
+        """Return (CachedResponse or None, generation to pass to ``set``)."""
+        raw, generation = await self.backend.get(key)
+        if raw is None:
+            self.misses += 1
+            return None, generation
+        entry = CachedResponse.from_bytes(raw)
+        if entry.missing:
+            self.negative_hits += 1
+        else:
+            self.hits += 1
+        return entry, generation
+
+    async def set(self, key, body, generation):
+        entry = CachedResponse(body, make_etag(body) if body is not None else None)
+        ttl = self.ttl if body is not None else self.negative_ttl
+        await self.backend.set(key, entry.to_bytes(), ttl, generation)
+        return entry
+
+    async def invalidate(self, key):
+        self.invalidations += 1
+        await self.backend.delete(key)
+
+    def stats(self):
+        lookups = self.hits + self.negative_hits + self.misses
+        stats = {
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits + self.negative_hits) / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+        }
+        if isinstance(self.backend, LocalBackend):
+            stats.update(evictions=self.backend.evictions, entries=len(self.backend), bytes=self.backend.size)
+        return stats
+
+
+dpp_cache = ResponseCache(RedisBackend(DPP_CACHE_URL) if DPP_CACHE_URL else None)
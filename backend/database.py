@@ -1,11 +1,32 @@
 import motor.motor_asyncio
 import os
 from dotenv import load_dotenv
+from metrics import CommandListener, PoolListener
 
 load_dotenv()
 
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://127.0.0.1:27017")
 DB_NAME = os.getenv("DB_NAME", "econetra")
 
-client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URI)
+client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URI, event_listeners=[CommandListener(), PoolListener()])
 db = client[DB_NAME]
+
+
+# Every GET /dpp query is an optional equality filter sorted by _id desc, so
+# each filter gets an (field, _id) index and pages are walked by _id range.
+DPP_INDEXES = [
+    [("product_id", 1), ("_id", -1)],
+    [("category", 1), ("_id", -1)],
+    [("batch_number", 1), ("_id", -1)],
+    [("supplier.name", 1), ("_id", -1)],
+    [("compliance_status", 1), ("_id", -1)],
+    [("category", 1), ("compliance_status", 1), ("_id", -1)],
+    # GET /dpp/changes walks documents and tombstones by version.
+    [("version", 1)],
+]
+
+
+async def ensure_indexes(db):
+    for keys in DPP_INDEXES:
+        await db.dpps.create_index(keys)
+    await db.dpp_tombstones.create_index([("version", 1)])
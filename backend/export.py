@@ -0,0 +1,97 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+
+from models.dpp import DPP, InvoiceDetails, Supplier
+
+# Flush to the client once this much output has been buffered.
+CHUNK_BYTES = 64 * 1024
+
+# traceability is a free-form dict; these are the keys the invoice extractor fills.
+TRACEABILITY_KEYS = ["origin_country", "factory_location", "transport_mode"]
+
+NESTED_COLUMNS = {
+    "supplier": list(Supplier.__fields__),
+    "invoice_details": list(InvoiceDetails.__fields__),
+    "traceability": TRACEABILITY_KEYS,
+}
+
+# Set on every write by sync.versioned, outside the DPP model.
+SYNC_COLUMNS = ["version", "updated_at"]
+
+CSV_COLUMNS = ["id"]
+for _name in DPP.__fields__:
+    if _name in NESTED_COLUMNS:
+        CSV_COLUMNS += [f"{_name}.{sub}" for sub in NESTED_COLUMNS[_name]]
+    else:
+        CSV_COLUMNS.append(_name)
+CSV_COLUMNS += SYNC_COLUMNS
+
+
+def _default(value):
+    # Datetimes as ISO 8601, the same as GET /dpp/{id} returns them.
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def flatten(doc):
+    """One CSV row for a stored DPP document."""
+    row = {"id": str(doc.get("_id", ""))}
+    for name in DPP.__fields__:
+        value = doc.get(name)
+        if name in NESTED_COLUMNS:
+            value = value or {}
+            for sub in NESTED_COLUMNS[name]:
+                row[f"{name}.{sub}"] = value.get(sub)
+        elif isinstance(value, list):
+            row[name] = "; ".join(str(v) for v in value)
+        else:
+            row[name] = value
+    for name in SYNC_COLUMNS:
+        value = doc.get(name)
+        row[name] = _default(value) if isinstance(value, datetime) else value
+    return [("" if row[c] is None else row[c]) for c in CSV_COLUMNS]
+
+
+def _ndjson_line(doc):
+    doc["id"] = str(doc.pop("_id"))
+    return json.dumps(doc, default=_default) + "\n"
+
+
+async def export_stream(cursor, fmt="ndjson", compress=False):
+    """Encode documents from a Motor cursor as NDJSON or CSV, optionally gzipped.
+
+    The first document is sent as soon as it arrives; after that output is
+    sent in ``CHUNK_BYTES`` pieces so memory stays constant however many
+    documents the cursor yields.
+    """
+    gz = zlib.compressobj(wbits=31) if compress else None
+    out = io.StringIO()
+    writer = None
+    if fmt == "csv":
+        writer = csv.writer(out)
+        writer.writerow(CSV_COLUMNS)
+
+    first = True
+    async for doc in cursor:
+        if writer:
+            writer.writerow(flatten(doc))
+        else:
+            out.write(_ndjson_line(doc))
+        if first or out.tell() >= CHUNK_BYTES:
+            data = out.getvalue().encode()
+            out.seek(0)
+            out.truncate()
+            if gz:
+                data = gz.compress(data) + gz.flush(zlib.Z_SYNC_FLUSH)
+            first = False
+            yield data
+
+    data = out.getvalue().encode()
+    if gz:
+        data = gz.compress(data) + gz.flush()
+    if data:
+        yield data
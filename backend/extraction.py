@@ -0,0 +1,385 @@
+import asyncio
+import hashlib
+import io
+import json
+import os
+import re
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from extraction_cache import ExtractionCache
+from invoice_rules import RULE_MIN_CONFIDENCE, extract_fields, to_dpp
+
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 1)))
+OCR_TIMEOUT = float(os.getenv("OCR_TIMEOUT", "60"))
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+# Jobs not yet finished beyond this many are refused instead of queued.
+EXTRACT_MAX_PENDING = int(os.getenv("EXTRACT_MAX_PENDING", "1000"))
+# Finished jobs are kept this many seconds for GET /extract-jobs/{id}.
+EXTRACT_JOB_TTL = float(os.getenv("EXTRACT_JOB_TTL", "3600"))
+# Path to the tesseract binary if it is not on PATH,
+# e.g. C:\Program Files\Tesseract-OCR\tesseract.exe on Windows.
+TESSERACT_CMD = os.getenv("TESSERACT_CMD")
+
+# --- Prompt / Schema we want the LLM to return ---
+DPP_SCHEMA_PROMPT = """
+You are an assistant that converts messy invoice text into a JSON matching the DPP schema below.
+Return only VALID JSON and nothing else (no explanation, no extra text).
+
+Schema:
+{
+  "product_id": "string or null",
+  "product_name": "string or null",
+  "category": "string or null",
+  "material_composition": "string or null",
+  "batch_number": "string or null",
+  "supplier": {
+    "name": "string or null",
+    "address": "string or null",
+    "contact": "string or null"
+  },
+  "manufacture_date": "string (YYYY-MM-DD) or null",
+  "expiry_date": "string (YYYY-MM-DD) or null",
+  "certifications": ["string", "..."] or [],
+  "sustainability_score": "string or null",
+  "invoice_details": {
+    "invoice_number": "string or null",
+    "invoice_date": "string or null",
+    "quantity": integer or null,
+    "price": float or null,
+    "currency": "string or null"
+  },
+  "traceability": {
+    "origin_country": "string or null",
+    "factory_location": "string or null",
+    "transport_mode": "string or null"
+  }
+}
+
+If a field cannot be found, set it to null (or [] for lists). Use best-effort parsing from the invoice text.
+Invoice text:
+{raw_text}
+"""
+
+# Shorter prompt used when a supplier template already filled most fields.
+FIELDS_PROMPT = """
+Extract the fields listed below from the invoice text.
+Return only a flat JSON object whose keys are exactly these field names, with null for any value not found.
+Dates as YYYY-MM-DD, quantity as an integer, price as a number without currency symbols.
+
+Fields:
+{fields}
+
+Invoice text:
+{raw_text}
+"""
+# Cached LLM results are tied to this; editing a prompt invalidates them.
+PROMPT_VERSION = hashlib.sha256((DPP_SCHEMA_PROMPT + FIELDS_PROMPT).encode()).hexdigest()[:12]
+
+
+class ExtractionError(Exception):
+    pass
+
+
+# --- OCR (runs in a worker process) ---
+def ocr_image(contents):
+    import pytesseract
+    from PIL import Image
+
+    if TESSERACT_CMD:
+        pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
+    try:
+        image = Image.open(io.BytesIO(contents))
+    except Exception as e:
+        raise ExtractionError(f"Uploaded file is not a valid image or cannot be opened: {e}")
+    # The timeout kills the tesseract subprocess, which also frees the worker.
+    return pytesseract.image_to_string(image, timeout=OCR_TIMEOUT)
+
+
+def build_prompt(raw_text, fields=None):
+    # str.format would trip over the braces in the schema.
+    if fields:
+        return FIELDS_PROMPT.replace("{fields}", "\n".join(fields)).replace("{raw_text}", raw_text)
+    return DPP_SCHEMA_PROMPT.replace("{raw_text}", raw_text)
+
+
+def parse_llm_output(llm_text):
+    """Parse the LLM reply as a JSON object, falling back to its first {...} block.
+
+    Anything else, including valid JSON that is not an object, comes back
+    as ``{"raw_llm_output": llm_text}``.
+    """
+    try:
+        parsed = json.loads(llm_text)
+    except Exception:
+        parsed = None
+        m = re.search(r'(\{[\s\S]*\})', llm_text or "")
+        if m:
+            try:
+                parsed = json.loads(m.group(1))
+            except Exception:
+                pass
+    if isinstance(parsed, dict):
+        return parsed
+    return {"raw_llm_output": llm_text}
+
+
+def lookup(data, field):
+    """Value of a dotted field from either a flat or a nested LLM reply."""
+    if field in data:
+        return data[field]
+    top, _, sub = field.partition(".")
+    value = data.get(top)
+    return value.get(sub) if sub and isinstance(value, dict) else None
+
+
+def merge_results(rules, llm_json, fields):
+    """Combine rule-extracted fields with the LLM reply; returns (dpp_json, rejected).
+
+    With ``fields`` (a matched template) only those fields are taken from
+    the LLM and the result is validated as a DPP; otherwise the LLM reply is
+    the base and confident rule values fill the fields it left empty.
+    """
+    if fields:
+        flat = dict(rules.values)
+        for field in fields:
+            value = lookup(llm_json, field)
+            if value is not None:
+                flat[field] = value
+        dpp_json, rejected = to_dpp_json(flat)
+        if "raw_llm_output" in llm_json:
+            dpp_json["raw_llm_output"] = llm_json["raw_llm_output"]
+        return dpp_json, rejected
+
+    dpp_json = dict(llm_json)
+    for field, value in rules.values.items():
+        if rules.confidence[field] < RULE_MIN_CONFIDENCE or lookup(dpp_json, field) is not None:
+            continue
+        top, _, sub = field.partition(".")
+        if sub:
+            if not isinstance(dpp_json.get(top), dict):
+                dpp_json[top] = {}
+            dpp_json[top][sub] = value
+        else:
+            dpp_json[top] = value
+    return dpp_json, {}
+
+
+def to_dpp_json(flat):
+    """Partially filled DPP as JSON, plus the values that failed validation."""
+    dpp, rejected = to_dpp(flat)
+    return dpp.dict(exclude_unset=True), rejected
+
+
+# --- LLM clients ---
+# Any object with ``async complete(prompt, model) -> Completion`` can be
+# passed to ExtractionPipeline, e.g. a local fake in tests.
+class Completion:
+    def __init__(self, text, tokens=0):
+        self.text = text
+        self.tokens = tokens
+
+
+class OpenAIClient:
+    def __init__(self, api_key=None):
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        self._client = None
+
+    async def complete(self, prompt, model):
+        if not self.api_key:
+            raise ExtractionError("OPENAI_API_KEY is not set. Set environment variable and restart server.")
+        import openai
+
+        messages = [{"role": "user", "content": prompt}]
+        if hasattr(openai, "AsyncOpenAI"):
+            if self._client is None:
+                self._client = openai.AsyncOpenAI(api_key=self.api_key)
+            resp = await self._client.chat.completions.create(model=model, messages=messages, temperature=0)
+            usage = resp.usage.total_tokens if resp.usage else 0
+            return Completion(resp.choices[0].message.content, usage)
+
+        # openai < 1.0 only has the blocking client; keep it off the event loop.
+        openai.api_key = self.api_key
+        resp = await asyncio.to_thread(openai.ChatCompletion.create, model=model, messages=messages, temperature=0)
+        return Completion(resp.choices[0].message["content"], resp.get("usage", {}).get("total_tokens", 0))
+
+
+# --- Jobs ---
+class Job:
+    def __init__(self, filename):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.status = "queued"
+        self.created_at = time.time()
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.task = None
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed")
+
+    def as_dict(self):
+        return {
+            "id": self.id,
+            "filename": self.filename,
+            "status": self.status,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class ExtractionPipeline:
+    """OCR in a bounded process pool, then the LLM call in a bounded async stage.
+
+    ``submit`` returns a Job straight away; the work runs as a background
+    task so request handlers never wait on Tesseract or the LLM. ``ocr`` and
+    ``executor`` can be swapped (e.g. for a thread pool and a stub) in tests.
+    With a ``cache``, repeated scans skip OCR and repeated texts skip the LLM.
+    """
+
+    def __init__(self, llm=None, ocr=ocr_image, executor=None, cache=None, ocr_workers=OCR_WORKERS,
+                 llm_concurrency=LLM_CONCURRENCY, ocr_timeout=OCR_TIMEOUT, llm_timeout=LLM_TIMEOUT,
+                 model=LLM_MODEL, max_pending=EXTRACT_MAX_PENDING, job_ttl=EXTRACT_JOB_TTL):
+        self.llm = llm or OpenAIClient()
+        self.ocr = ocr
+        self.cache = cache
+        self.model = model
+        self.ocr_workers = ocr_workers
+        self.ocr_timeout = ocr_timeout
+        self.llm_timeout = llm_timeout
+        self.max_pending = max_pending
+        self.job_ttl = job_ttl
+        self.jobs = {}
+        self.pending = 0
+        self._executor = executor
+        # Waiting uploads queue here rather than inside the pool.
+        self._ocr_slots = asyncio.Semaphore(ocr_workers)
+        self._llm_slots = asyncio.Semaphore(llm_concurrency)
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.ocr_workers)
+        return self._executor
+
+    def submit(self, contents, filename=None):
+        return self.submit_many([(contents, filename)])[0]
+
+    def submit_many(self, files):
+        """Start a job per (contents, filename); all of them are accepted or none is."""
+        self._prune()
+        if self.pending + len(files) > self.max_pending:
+            raise ExtractionError("Too many extraction jobs in progress, retry later")
+        jobs = []
+        for contents, filename in files:
+            job = Job(filename)
+            self.jobs[job.id] = job
+            self.pending += 1
+            job.task = asyncio.create_task(self._run(job, contents))
+            jobs.append(job)
+        return jobs
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    async def _run(self, job, contents):
+        try:
+            job.status = "ocr"
+            raw_text = await self.run_ocr(contents)
+            job.result = {"raw_text": raw_text}
+            job.result.update(await self.extract(raw_text, job))
+            job.status = "done"
+        except asyncio.TimeoutError:
+            job.error = f"{'OCR' if job.status == 'ocr' else 'LLM'} step timed out"
+            job.status = "failed"
+        except Exception as e:
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+            self.pending -= 1
+
+    async def run_ocr(self, contents):
+        if self.cache:
+            raw_text = await self.cache.get_ocr(contents)
+            if raw_text is not None:
+                return raw_text
+        async with self._ocr_slots:
+            loop = asyncio.get_running_loop()
+            started = time.perf_counter()
+            raw_text = await asyncio.wait_for(
+                loop.run_in_executor(self.executor, self.ocr, contents), self.ocr_timeout
+            )
+        if self.cache:
+            await self.cache.put_ocr(contents, raw_text, time.perf_counter() - started)
+        return raw_text
+
+    async def extract(self, raw_text, job=None):
+        """Rule-based fields first; the LLM is only asked for what they could not fill.
+
+        For a supplier with a matching template that is just the missing or
+        low-confidence required fields (possibly none); for unknown layouts
+        the full schema prompt is still used. If the LLM call fails for a
+        matched template, the rule fields are returned with ``error`` set and
+        ``llm_fields`` listing what is still missing.
+        """
+        rules = extract_fields(raw_text)
+        fields = rules.missing() if rules.template else None
+        result = {
+            "template": rules.template["name"] if rules.template else None,
+            "confidence": rules.confidence,
+            "llm_fields": fields,
+        }
+        if fields == []:
+            result["dpp_json"], result["rejected"] = to_dpp_json(rules.values)
+            return result
+        if job:
+            job.status = "llm"
+        try:
+            llm_json = await self.run_llm(raw_text, fields)
+        except Exception as e:
+            if not rules.template:
+                raise
+            result["error"] = "LLM step timed out" if isinstance(e, asyncio.TimeoutError) else str(e)
+            result["dpp_json"], result["rejected"] = to_dpp_json(rules.values)
+            return result
+        result["dpp_json"], result["rejected"] = merge_results(rules, llm_json, fields)
+        return result
+
+    async def run_llm(self, raw_text, fields=None):
+        if self.cache:
+            parsed = await self.cache.get_llm(raw_text, self.model, fields)
+            if parsed is not None:
+                return parsed
+        async with self._llm_slots:
+            started = time.perf_counter()
+            completion = await asyncio.wait_for(
+                self.llm.complete(build_prompt(raw_text, fields), self.model), self.llm_timeout
+            )
+        parsed = parse_llm_output(completion.text)
+        # Replies that were not valid JSON are worth retrying, so they are not cached.
+        if self.cache and "raw_llm_output" not in parsed:
+            await self.cache.put_llm(raw_text, self.model, parsed, time.perf_counter() - started, completion.tokens, fields)
+        return parsed
+
+    def _prune(self):
+        cutoff = time.time() - self.job_ttl
+        for job_id in [j.id for j in self.jobs.values() if j.finished and j.finished_at < cutoff]:
+            del self.jobs[job_id]
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+        if self.cache:
+            self.cache.close()
+
+
+extraction_pipeline = ExtractionPipeline(cache=ExtractionCache(prompt_version=PROMPT_VERSION))
@@ -0,0 +1,177 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+EXTRACT_CACHE_PATH = os.getenv("EXTRACT_CACHE_PATH", "extraction-cache.sqlite3")
+EXTRACT_CACHE_MAX_BYTES = int(os.getenv("EXTRACT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ocr (
+    key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,
+    seconds REAL NOT NULL, used REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS llm (
+    key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,
+    seconds REAL NOT NULL, tokens INTEGER NOT NULL, prompt_version TEXT NOT NULL, used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ocr_used ON ocr (used);
+CREATE INDEX IF NOT EXISTS llm_used ON llm (used);
+"""
+
+
+def _sha256(*parts):
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part if isinstance(part, bytes) else part.encode())
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def normalize_text(raw_text):
+    # OCR output of the same scan can differ only in whitespace between runs.
+    return " ".join(raw_text.split())
+
+
+class LevelStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+        self.tokens_saved = 0
+
+    def as_dict(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "seconds_saved": round(self.seconds_saved, 3),
+            "tokens_saved": self.tokens_saved,
+        }
+
+
+class ExtractionCache:
+    """Two-level SQLite cache: image bytes -> OCR text, and OCR text -> parsed LLM JSON.
+
+    LLM entries are keyed on the prompt version and model as well, and
+    entries from any other prompt version are deleted when the cache is
+    opened. Once the stored values exceed ``max_bytes`` the least recently
+    used entries of either level are evicted.
+    """
+
+    def __init__(self, path=EXTRACT_CACHE_PATH, max_bytes=EXTRACT_CACHE_MAX_BYTES, prompt_version=""):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.prompt_version = prompt_version
+        self.size = 0
+        self.evictions = 0
+        self.ocr_stats = LevelStats()
+        self.llm_stats = LevelStats()
+        self._conn = None
+        self._lock = threading.Lock()
+
+    # All SQLite work happens in a worker thread, serialized by the lock.
+    async def _call(self, fn, *args):
+        return await asyncio.to_thread(self._locked, fn, *args)
+
+    def _locked(self, fn, *args):
+        with self._lock:
+            if self._conn is None:
+                self._open()
+            return fn(*args)
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        conn.execute("DELETE FROM llm WHERE prompt_version != ?", (self.prompt_version,))
+        self.size = sum(conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {t}").fetchone()[0] for t in ("ocr", "llm"))
+        self._conn = conn
+
+    def _get(self, table, key):
+        row = self._conn.execute(f"SELECT value, seconds, {'tokens' if table == 'llm' else '0'} FROM {table} WHERE key = ?", (key,)).fetchone()
+        if row:
+            self._conn.execute(f"UPDATE {table} SET used = ? WHERE key = ?", (time.time(), key))
+        return row
+
+    def _put(self, table, key, row):
+        old = self._conn.execute(f"SELECT size FROM {table} WHERE key = ?", (key,)).fetchone()
+        self.size += row["size"] - (old[0] if old else 0)
+        columns = ", ".join(row)
+        self._conn.execute(
+            f"INSERT OR REPLACE INTO {table} (key, {columns}) VALUES (?, {', '.join('?' * len(row))})",
+            (key, *row.values()),
+        )
+        if self.size > self.max_bytes:
+            self._evict()
+
+    def _evict(self):
+        # Trim to 90% so a full cache does not evict on every insert.
+        target = self.max_bytes * 0.9
+        while self.size > target:
+            oldest = self._conn.execute(
+                "SELECT 'ocr', key, size, used FROM ocr UNION ALL SELECT 'llm', key, size, used FROM llm "
+                "ORDER BY used LIMIT 100"
+            ).fetchall()
+            if not oldest:
+                break
+            for table, key, size, _ in oldest:
+                self._conn.execute(f"DELETE FROM {table} WHERE key = ?", (key,))
+                self.size -= size
+                self.evictions += 1
+                if self.size <= target:
+                    break
+
+    # --- Level 1: image bytes -> OCR text ---
+    async def get_ocr(self, contents):
+        row = await self._call(self._get, "ocr", _sha256(contents))
+        if row is None:
+            self.ocr_stats.misses += 1
+            return None
+        self.ocr_stats.hits += 1
+        self.ocr_stats.seconds_saved += row[1]
+        return row[0]
+
+    async def put_ocr(self, contents, raw_text, seconds):
+        row = {"value": raw_text, "size": len(raw_text.encode()), "seconds": seconds, "used": time.time()}
+        await self._call(self._put, "ocr", _sha256(contents), row)
+
+    # --- Level 2: (OCR text, prompt version, model, requested fields) -> parsed JSON ---
+    def _llm_key(self, raw_text, model, fields):
+        return _sha256(self.prompt_version, model, ",".join(fields or ()), normalize_text(raw_text))
+
+    async def get_llm(self, raw_text, model, fields=None):
+        row = await self._call(self._get, "llm", self._llm_key(raw_text, model, fields))
+        if row is None:
+            self.llm_stats.misses += 1
+            return None
+        self.llm_stats.hits += 1
+        self.llm_stats.seconds_saved += row[1]
+        self.llm_stats.tokens_saved += row[2]
+        return json.loads(row[0])
+
+    async def put_llm(self, raw_text, model, dpp_json, seconds, tokens, fields=None):
+        value = json.dumps(dpp_json)
+        row = {
+            "value": value, "size": len(value), "seconds": seconds, "tokens": tokens,
+            "prompt_version": self.prompt_version, "used": time.time(),
+        }
+        await self._call(self._put, "llm", self._llm_key(raw_text, model, fields), row)
+
+    def stats(self):
+        return {
+            "ocr": self.ocr_stats.as_dict(),
+            "llm": self.llm_stats.as_dict(),
+            "bytes": self.size,
+            "evictions": self.evictions,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
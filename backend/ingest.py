@@ -0,0 +1,244 @@
+import asyncio
+import codecs
+import json
+import logging
+import os
+from contextlib import nullcontext
+
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
+
+from models.dpp import DPP
+
+logger = logging.getLogger(__name__)
+
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "1000"))
+BULK_MAX_IN_FLIGHT = int(os.getenv("BULK_MAX_IN_FLIGHT", "4"))
+BULK_MAX_ERRORS = int(os.getenv("BULK_MAX_ERRORS", "1000"))
+# A single record bigger than this is rejected instead of being buffered.
+MAX_RECORD_BYTES = int(os.getenv("BULK_MAX_RECORD_BYTES", str(1024 * 1024)))
+
+
+class RecordError(Exception):
+    pass
+
+
+# --- NDJSON ---
+async def _prepend(first, chunks):
+    if first:
+        yield first
+    async for chunk in chunks:
+        yield chunk
+
+
+async def iter_ndjson(chunks, first=b""):
+    """Yield (line_no, obj or RecordError) for every non-blank line."""
+    buf = b""
+    line_no = 0
+    skipping = False
+    # ``first`` goes through the loop too; small bodies often arrive whole in it.
+    async for chunk in _prepend(first, chunks):
+        buf += chunk
+        start = 0
+        while True:
+            end = buf.find(b"\n", start)
+            if end == -1:
+                break
+            line_no += 1
+            line = buf[start:end]
+            start = end + 1
+            if skipping:
+                skipping = False
+                continue
+            if line.strip():
+                yield line_no, _loads(line)
+        buf = buf[start:]
+        if not skipping and len(buf) > MAX_RECORD_BYTES:
+            # Drop the oversized line and resync on the next newline.
+            yield line_no + 1, RecordError(f"record exceeds {MAX_RECORD_BYTES} bytes")
+            skipping = True
+        if skipping:
+            buf = b""
+    if buf.strip() and not skipping:
+        yield line_no + 1, _loads(buf)
+
+
+def _loads(raw):
+    try:
+        return json.loads(raw)
+    except ValueError as e:
+        return RecordError(f"invalid JSON: {e}")
+
+
+# --- JSON array ---
+async def iter_json_array(chunks, first=b""):
+    """Yield (index, obj or RecordError) for every element of a top-level array.
+
+    Elements are decoded one at a time with ``raw_decode`` so only the
+    element currently being read is held in memory.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buf = utf8.decode(first)
+    pos = 0
+    index = 0
+    opened = False
+    eof = False
+    chunks = chunks.__aiter__()
+
+    while True:
+        # Skip separators between elements.
+        while pos < len(buf) and (buf[pos].isspace() or (opened and buf[pos] == ",")):
+            pos += 1
+        if pos < len(buf):
+            if not opened:
+                if buf[pos] != "[":
+                    yield index, RecordError("body must be a JSON array or NDJSON")
+                    return
+                opened = True
+                pos += 1
+                continue
+            if buf[pos] == "]":
+                return
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except ValueError as e:
+                if eof or len(buf) - pos > MAX_RECORD_BYTES:
+                    # An array cannot be resynced after a broken element.
+                    yield index, RecordError(f"invalid JSON: {e}")
+                    return
+            else:
+                yield index, obj
+                index += 1
+                pos = end
+                continue
+        elif eof:
+            if opened:
+                yield index, RecordError("unterminated JSON array")
+            return
+
+        try:
+            chunk = await chunks.__anext__()
+        except StopAsyncIteration:
+            buf = buf[pos:] + utf8.decode(b"", final=True)
+            pos = 0
+            eof = True
+        else:
+            buf = buf[pos:] + utf8.decode(chunk)
+            pos = 0
+
+
+async def iter_records(chunks):
+    """Sniff the body format from its first non-blank byte and parse it lazily."""
+    chunks = chunks.__aiter__()
+    first = b""
+    async for chunk in chunks:
+        first += chunk
+        if first.strip():
+            break
+    if first.lstrip()[:1] == b"[":
+        return "index", iter_json_array(chunks, first)
+    return "line", iter_ndjson(chunks, first)
+
+
+# --- Bulk insert ---
+class BulkReport:
+    def __init__(self, position_key, max_errors=BULK_MAX_ERRORS):
+        self.position_key = position_key
+        self.max_errors = max_errors
+        self.received = 0
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+        self.errors_truncated = False
+
+    def fail(self, position, error):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({self.position_key: position, "error": error})
+        else:
+            self.errors_truncated = True
+
+    def as_dict(self):
+        return {
+            "received": self.received,
+            "inserted": self.inserted,
+            "failed": self.failed,
+            "errors": sorted(self.errors, key=lambda e: e[self.position_key]),
+            "errors_truncated": self.errors_truncated,
+        }
+
+
+async def _flush(collection, docs, positions, report):
+    try:
+        result = await collection.insert_many(docs, ordered=False)
+        report.inserted += len(result.inserted_ids)
+    except BulkWriteError as e:
+        details = e.details or {}
+        report.inserted += details.get("nInserted", 0)
+        for err in details.get("writeErrors", []):
+            report.fail(positions[err["index"]], err.get("errmsg", "write failed"))
+    except Exception as e:
+        for position in positions:
+            report.fail(position, f"batch insert failed: {e}")
+
+
+async def bulk_insert(collection, chunks, batch_size=BULK_BATCH_SIZE, max_in_flight=BULK_MAX_IN_FLIGHT,
+                      write_context=None):
+    """Validate a streamed NDJSON / JSON array body against DPP and insert it in batches.
+
+    Batches are written with ``insert_many(ordered=False)``; at most
+    ``max_in_flight`` of them are outstanding at once, which also stops the
+    request body from being read faster than Mongo can absorb it.
+    ``write_context``, if given, is called with each batch of documents and
+    the returned async context manager is held around that batch's write.
+    """
+    position_key, records = await iter_records(chunks)
+    report = BulkReport(position_key)
+    slots = asyncio.Semaphore(max_in_flight)
+    tasks = []
+
+    async def write(docs, positions):
+        flushed = False
+        try:
+            async with (write_context(docs) if write_context else nullcontext()):
+                await _flush(collection, docs, positions, report)
+                flushed = True
+        except Exception as e:
+            if not flushed:
+                for position in positions:
+                    report.fail(position, f"batch insert failed: {e}")
+            else:
+                # The documents are in; only leaving the context failed.
+                logger.exception("Closing the write context of a bulk batch failed")
+        finally:
+            slots.release()
+
+    async def submit(docs, positions):
+        await slots.acquire()
+        tasks.append(asyncio.create_task(write(docs, positions)))
+
+    docs, positions = [], []
+    async for position, obj in records:
+        report.received += 1
+        if isinstance(obj, RecordError):
+            report.fail(position, str(obj))
+            continue
+        if not isinstance(obj, dict):
+            report.fail(position, "record must be a JSON object")
+            continue
+        try:
+            docs.append(DPP(**obj).dict())
+        except ValidationError as e:
+            report.fail(position, str(e))
+            continue
+        positions.append(position)
+        if len(docs) >= batch_size:
+            await submit(docs, positions)
+            docs, positions = [], []
+
+    if docs:
+        await submit(docs, positions)
+    if tasks:
+        await asyncio.gather(*tasks)
+    return report.as_dict()
@@ -0,0 +1,272 @@
+"""Deterministic invoice field extraction that runs on OCR text before the LLM.
+
+Generic rules cover common labels ("Invoice No", "Qty", "Batch No", GSTINs,
+...). Suppliers with a fixed layout can be described by a JSON file in
+INVOICE_TEMPLATES_DIR, picked up without a restart::
+
+    {
+      "name": "acme-textiles",
+      "match": {"gstin": ["27AAACA1234A1Z5"], "pattern": "ACME TEXTILES"},
+      "fields": {
+        "invoice_details.invoice_number": "Bill No\\\\s*:\\\\s*(\\\\S+)",
+        "invoice_details.price": {"pattern": "Net Payable\\\\s*([\\\\d,.]+)", "confidence": 0.9}
+      },
+      "defaults": {"supplier.name": "Acme Textiles", "category": "Textiles"},
+      "required": ["supplier.name", "invoice_details.invoice_number", "invoice_details.price"]
+    }
+
+Template patterns take the first capture group. A template matches when any
+listed GSTIN appears in the text or ``pattern`` is found.
+"""
+import json
+import logging
+import os
+import re
+from datetime import date
+
+from pydantic import ValidationError
+
+from models.dpp import DPP
+
+logger = logging.getLogger(__name__)
+
+INVOICE_TEMPLATES_DIR = os.getenv("INVOICE_TEMPLATES_DIR", "invoice_templates")
+# Fields at or above this confidence are not sent to the LLM.
+RULE_MIN_CONFIDENCE = float(os.getenv("RULE_MIN_CONFIDENCE", "0.7"))
+TEMPLATE_CONFIDENCE = 0.95
+
+# Fields a matched template must fill before the LLM can be skipped.
+DEFAULT_REQUIRED = [
+    "product_name",
+    "supplier.name",
+    "invoice_details.invoice_number",
+    "invoice_details.invoice_date",
+    "invoice_details.quantity",
+    "invoice_details.price",
+    "invoice_details.currency",
+]
+
+FIELD_TYPES = {
+    "invoice_details.quantity": "int",
+    "invoice_details.price": "float",
+    "invoice_details.invoice_date": "date",
+    "manufacture_date": "date",
+    "expiry_date": "date",
+    "sustainability_score": "float",
+}
+
+MONTHS = {m: i for i, m in enumerate(
+    ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"], 1)}
+
+_DATE = r"(\d{4}-\d{1,2}-\d{1,2}|\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4}|\d{1,2}[ -][A-Za-z]{3,9}[ ,-]+\d{4})"
+_LABEL_SEP = r"\.?\s*[:#-]?\s*"
+
+# Dated labels that are not the invoice date ("Mfg. Date", "Due Date", ...);
+# a bare "Date" directly after one of these is skipped.
+_OTHER_DATES = ["mfg", "mfd", "manufacture", "manufacturing", "packing", "pkg", "due", "exp", "expiry",
+                "delivery", "dispatch", "shipping", "order", "po"]
+_NOT_OTHER_DATE = "".join(f"(?<!{w}{sep})" for w in _OTHER_DATES for sep in (" ", "  ", ".", ". ", "-", "_"))
+
+GSTIN = re.compile(r"\b(\d{2}[A-Z]{5}\d{4}[A-Z][1-9A-Z]Z[0-9A-Z])\b")
+
+# (field, pattern, confidence); the first matching rule per field wins.
+GENERIC_RULES = [
+    # Labels match in any case; the number itself must be upper case and contain a digit.
+    ("invoice_details.invoice_number", r"\b(?i:invoice|inv|bill)\s*(?i:no|number|#)" + _LABEL_SEP + r"(?=[A-Z/_-]*\d)([A-Z0-9][A-Z0-9/_-]{2,})", 0.85),
+    ("invoice_details.invoice_date", r"(?i)\b(?:invoice|inv|bill)\s*date" + _LABEL_SEP + _DATE, 0.85),
+    ("invoice_details.invoice_date", r"(?i)" + _NOT_OTHER_DATE + r"\bdate(?:d)?" + _LABEL_SEP + _DATE, 0.7),
+    ("manufacture_date", r"(?i)\b(?:mfg|mfd|manufactur\w*)\s*(?:date|dt|on)?" + _LABEL_SEP + _DATE, 0.8),
+    ("expiry_date", r"(?i)\b(?:exp(?:iry)?|best before|use by)\s*(?:date|dt)?" + _LABEL_SEP + _DATE, 0.8),
+    ("invoice_details.quantity", r"(?i)\b(?:qty|quantity)" + _LABEL_SEP + r"(\d[\d,]*)", 0.75),
+    ("invoice_details.price", r"(?i)\b(?:grand\s+total|total\s+amount|amount\s+payable|net\s+payable)" + _LABEL_SEP + r"(?:₹|rs\.?|inr|usd|\$|eur|€)?\s*(\d[\d,]*(?:\.\d{1,2})?)", 0.8),
+    ("invoice_details.price", r"(?i)\btotal" + _LABEL_SEP + r"(?:₹|rs\.?|inr|usd|\$|eur|€)?\s*(\d[\d,]*(?:\.\d{1,2})?)", 0.6),
+    ("batch_number", r"\b(?i:batch|lot)\s*(?i:no|number|#)?" + _LABEL_SEP + r"([A-Z0-9][A-Z0-9/_-]+)", 0.8),
+]
+GENERIC_RULES = [(f, re.compile(p), c) for f, p, c in GENERIC_RULES]
+
+CURRENCIES = [
+    ("INR", re.compile(r"₹|\bINR\b|\bRs\.?(?=\s|\d)")),
+    ("USD", re.compile(r"\bUSD\b|US\$|\$")),
+    ("EUR", re.compile(r"€|\bEUR\b")),
+    ("GBP", re.compile(r"£|\bGBP\b")),
+]
+
+
+def parse_date(value):
+    """Normalize a date to YYYY-MM-DD; numeric dates are read day first."""
+    value = value.strip()
+    m = re.fullmatch(r"(\d{4})-(\d{1,2})-(\d{1,2})", value)
+    if m:
+        y, mo, d = (int(g) for g in m.groups())
+    else:
+        m = re.fullmatch(r"(\d{1,2})[/.-](\d{1,2})[/.-](\d{2,4})", value)
+        if m:
+            d, mo, y = (int(g) for g in m.groups())
+        else:
+            m = re.fullmatch(r"(\d{1,2})[ -]([A-Za-z]{3,9})[ ,-]+(\d{4})", value)
+            if not m or m.group(2)[:3].lower() not in MONTHS:
+                return None
+            d, mo, y = int(m.group(1)), MONTHS[m.group(2)[:3].lower()], int(m.group(3))
+        if y < 100:
+            y += 2000
+    try:
+        return date(y, mo, d).isoformat()
+    except ValueError:
+        return None
+
+
+def convert(field, value):
+    kind = FIELD_TYPES.get(field)
+    value = value.strip()
+    try:
+        if kind == "int":
+            return int(value.replace(",", ""))
+        if kind == "float":
+            return float(value.replace(",", ""))
+    except ValueError:
+        return None
+    if kind == "date":
+        return parse_date(value)
+    return value or None
+
+
+class RuleResult:
+    def __init__(self, template=None):
+        self.template = template
+        self.values = {}
+        self.confidence = {}
+
+    def add(self, field, value, confidence):
+        if value is None or self.confidence.get(field, 0) >= confidence:
+            return
+        self.values[field] = value
+        self.confidence[field] = confidence
+
+    @property
+    def required(self):
+        if self.template and self.template.get("required"):
+            return self.template["required"]
+        return DEFAULT_REQUIRED
+
+    def missing(self, min_confidence=RULE_MIN_CONFIDENCE):
+        """Required fields that were not found with enough confidence."""
+        return [f for f in self.required if self.confidence.get(f, 0) < min_confidence]
+
+
+
+def nest(flat):
+    nested = {}
+    for field, value in flat.items():
+        top, _, sub = field.partition(".")
+        if sub:
+            nested.setdefault(top, {})[sub] = value
+        else:
+            nested[top] = value
+    return nested
+
+
+def to_dpp(flat):
+    """A partially filled DPP from dotted field values.
+
+    Values that do not validate are left out and returned as ``rejected``
+    (dotted field -> value). A nested block missing a required field, such
+    as a supplier with a GSTIN but no name, is left out whole.
+    """
+    data = nest(flat)
+    rejected = {}
+    while True:
+        try:
+            return DPP(**data), rejected
+        except ValidationError as e:
+            error = e
+        dropped = False
+        for detail in error.errors():
+            loc = detail["loc"]
+            if not loc or loc[0] not in data:
+                continue  # already dropped for an earlier error
+            top, block = loc[0], data[loc[0]]
+            if len(loc) > 1 and isinstance(block, dict) and loc[1] in block:
+                rejected[f"{top}.{loc[1]}"] = block.pop(loc[1])
+            else:
+                rejected[top] = data.pop(top)
+            dropped = True
+        if not dropped:
+            raise error
+
+
+# --- Supplier templates ---
+class TemplateRegistry:
+    """JSON supplier templates from a directory, reloaded when the directory changes."""
+
+    def __init__(self, directory=INVOICE_TEMPLATES_DIR):
+        self.directory = directory
+        self._stamp = None
+        self._templates = []
+
+    def templates(self):
+        try:
+            names = sorted(n for n in os.listdir(self.directory) if n.endswith(".json"))
+            stamp = [(n, os.stat(os.path.join(self.directory, n)).st_mtime_ns) for n in names]
+        except FileNotFoundError:
+            names, stamp = [], []
+        if stamp != self._stamp:
+            self._templates = [t for t in (self._load(n) for n in names) if t]
+            self._stamp = stamp
+        return self._templates
+
+    def _load(self, name):
+        try:
+            with open(os.path.join(self.directory, name), encoding="utf-8") as f:
+                spec = json.load(f)
+            match = spec.get("match", {})
+            spec["_gstins"] = set(match.get("gstin", []))
+            spec["_pattern"] = re.compile(match["pattern"], re.I) if match.get("pattern") else None
+            spec["_fields"] = []
+            for field, rule in spec.get("fields", {}).items():
+                if isinstance(rule, str):
+                    rule = {"pattern": rule}
+                spec["_fields"].append((field, re.compile(rule["pattern"]), rule.get("confidence", TEMPLATE_CONFIDENCE)))
+            spec.setdefault("name", name[:-5])
+            return spec
+        except (OSError, ValueError, KeyError, re.error) as e:
+            logger.warning("Skipping invoice template %s: %s", name, e)
+            return None
+
+    def match(self, text, gstins):
+        for spec in self.templates():
+            if spec["_gstins"] & gstins or (spec["_pattern"] and spec["_pattern"].search(text)):
+                return spec
+        return None
+
+
+template_registry = TemplateRegistry()
+
+
+def extract_fields(raw_text, registry=template_registry):
+    gstins = GSTIN.findall(raw_text)
+    template = registry.match(raw_text, set(gstins))
+    result = RuleResult(template)
+
+    if template:
+        for field, value in template.get("defaults", {}).items():
+            result.add(field, value, 1.0)
+        for field, pattern, confidence in template["_fields"]:
+            m = pattern.search(raw_text)
+            if m:
+                result.add(field, convert(field, m.group(1) if m.groups() else m.group(0)), confidence)
+
+    for field, pattern, confidence in GENERIC_RULES:
+        if field in result.values:
+            continue
+        m = pattern.search(raw_text)
+        if m:
+            result.add(field, convert(field, m.group(1)), confidence)
+
+    if gstins:
+        # The first GSTIN on an invoice is usually the seller's.
+        result.add("supplier.gstin", gstins[0], 0.9 if len(set(gstins)) == 1 else 0.7)
+    for code, pattern in CURRENCIES:
+        if pattern.search(raw_text):
+            result.add("invoice_details.currency", code, 0.8)
+            break
+    return result
@@ -1,8 +1,25 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+import json
+from typing import List, Optional
+from fastapi import Depends, FastAPI, File, HTTPException, Query, Request, Response, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
 from bson.objectid import ObjectId
-from database import db
+from cache import dpp_cache
+from database import db, ensure_indexes
+from export import export_stream
+from extraction import ExtractionError, extraction_pipeline
+from ingest import bulk_insert, BULK_BATCH_SIZE, BULK_MAX_IN_FLIGHT
+from metrics import CallbackGauge, MetricsMiddleware, registry
 from models.dpp import DPP
+from models.qr import QRBatchRequest
+from qr import MEDIA_TYPES, QROptions, dpp_url, iter_zip, qr_service
+from queries import QueryError, build_filter, build_projection, encode_cursor, page_filter
+from sync import (
+    TokenError, backfill_versions, change_events, changes_since, decode_token, expire_leases, latest_token,
+    notifier, versioned, SYNC_PAGE_LIMIT,
+)
 
 app = FastAPI(title="Econetra DPP API")
 
@@ -12,7 +29,21 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
+app.add_middleware(MetricsMiddleware)
+
+@app.on_event("startup")
+async def startup():
+    await ensure_indexes(db)
+    await expire_leases(db)
+    await backfill_versions(db)
+
+@app.on_event("shutdown")
+async def shutdown():
+    qr_service.shutdown()
+    notifier.stop()
+    extraction_pipeline.shutdown()
 
 # --- Health Check ---
 @app.get("/status")
@@ -28,33 +59,218 @@ async def root():
 @app.post("/dpp", status_code=201)
 async def create_dpp(dpp: DPP):
     doc = dpp.dict()
-    result = await db.dpps.insert_one(doc)
+    async with versioned(db, [doc]):
+        result = await db.dpps.insert_one(doc)
     return {"id": str(result.inserted_id)}
 
+# --- Bulk create DPPs (NDJSON or JSON array body) ---
+@app.post("/dpp/bulk")
+async def bulk_create_dpps(
+    request: Request,
+    batch_size: int = Query(BULK_BATCH_SIZE, ge=1, le=10000),
+    max_in_flight: int = Query(BULK_MAX_IN_FLIGHT, ge=1, le=32),
+):
+    return await bulk_insert(
+        db.dpps, request.stream(), batch_size=batch_size, max_in_flight=max_in_flight,
+        write_context=lambda docs: versioned(db, docs),
+    )
+
+# --- Filters shared by list and export ---
+def dpp_filter(
+    product_id: Optional[str] = None,
+    category: Optional[str] = None,
+    batch_number: Optional[str] = None,
+    supplier_name: Optional[str] = None,
+    compliance_status: Optional[str] = None,
+):
+    return build_filter({
+        "product_id": product_id,
+        "category": category,
+        "batch_number": batch_number,
+        "supplier_name": supplier_name,
+        "compliance_status": compliance_status,
+    })
+
 # --- List DPPs ---
+# Newest first. When more results exist the X-Next-Cursor response header
+# holds the value to pass back as ?cursor= for the next page.
 @app.get("/dpp")
-async def list_dpps(limit: int = 50):
-    cursor = db.dpps.find().sort([("_id", -1)]).limit(limit)
+async def list_dpps(
+    response: Response,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    filters: dict = Depends(dpp_filter),
+):
+    try:
+        query = page_filter(filters, cursor)
+        projection = build_projection(fields)
+    except QueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Fetch one extra document to know whether there is a next page.
+    db_cursor = db.dpps.find(query, projection).sort([("_id", -1)]).limit(limit + 1)
     items = []
-    async for doc in cursor:
+    last_id = None
+    async for doc in db_cursor:
+        if len(items) == limit:
+            response.headers["X-Next-Cursor"] = encode_cursor(last_id)
+            break
+        last_id = doc["_id"]
         doc["id"] = str(doc["_id"])
         doc.pop("_id", None)
         items.append(doc)
     return items
 
+# --- Delta sync ---
+# Pass the returned "next" token back as ?since= to get only what changed
+# after it; with no token everything is returned, page by page. Clients
+# that load a page of GET /dpp instead take GET /dpp/changes/latest first.
+@app.get("/dpp/changes/latest")
+async def get_latest_token():
+    return {"next": await latest_token(db)}
+
+@app.get("/dpp/changes")
+async def list_changes(since: Optional[str] = None, limit: int = Query(SYNC_PAGE_LIMIT, ge=1, le=5000)):
+    try:
+        version = decode_token(since)
+    except TokenError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await changes_since(db, version, limit)
+
+# Server-sent events with the same payload, pushed as changes happen.
+@app.get("/dpp/changes/stream")
+async def stream_changes(request: Request, since: Optional[str] = None):
+    try:
+        version = decode_token(request.headers.get("last-event-id") or since)
+    except TokenError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(
+        change_events(db, version, request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# --- Export DPPs (streamed NDJSON / CSV) ---
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+@app.get("/dpp/export")
+async def export_dpps(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    compress: bool = False,
+    batch_size: int = Query(1000, ge=1, le=10000),
+    filters: dict = Depends(dpp_filter),
+):
+    cursor = db.dpps.find(filters).sort([("_id", 1)]).batch_size(batch_size)
+    filename = f"dpps.{format}"
+    media_type = EXPORT_MEDIA_TYPES[format]
+    if compress:
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        export_stream(cursor, format, compress),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
 # --- Get single DPP ---
-@app.get("/dpp/{dpp_id}")
-async def get_dpp(dpp_id: str):
+# This is the URL printed in every QR code, so the serialized response is
+# cached (see cache.py) and served with an ETag for conditional requests.
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+async def load_dpp(dpp_id):
+    """The cached response for a DPP, read from Mongo on a miss; ``missing`` if it does not exist."""
+    entry, generation = await dpp_cache.get(dpp_id)
+    if entry is not None:
+        return entry
     try:
         oid = ObjectId(dpp_id)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid DPP id")
     record = await db.dpps.find_one({"_id": oid})
-    if not record:
+    body = None
+    if record:
+        record["id"] = str(record["_id"])
+        record.pop("_id", None)
+        body = json.dumps(jsonable_encoder(record), ensure_ascii=False, separators=(",", ":")).encode()
+    return await dpp_cache.set(dpp_id, body, generation)
+
+@app.get("/dpp/{dpp_id}")
+async def get_dpp(dpp_id: str, request: Request):
+    entry = await load_dpp(dpp_id)
+    if entry.missing:
+        raise HTTPException(status_code=404, detail="DPP not found")
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(entry.body, media_type="application/json", headers=headers)
+
+# --- QR codes ---
+QR_BATCH_MAX = 10000
+# Rendered codes never change for a given URL and options.
+QR_CACHE_HEADERS = {"Cache-Control": "public, max-age=31536000, immutable"}
+
+def check_dpp_id(dpp_id):
+    if not ObjectId.is_valid(dpp_id):
+        raise HTTPException(status_code=400, detail=f"Invalid DPP id: {dpp_id}")
+
+@app.get("/dpp/{dpp_id}/qr")
+async def get_dpp_qr(
+    dpp_id: str,
+    format: str = Query("png", pattern="^(png|svg)$"),
+    box_size: int = Query(10, ge=1, le=50),
+    border: int = Query(4, ge=0, le=20),
+    error_correction: str = Query("M", pattern="^[LMQH]$"),
+):
+    # Only existing DPPs get codes, so the on-disk cache cannot be filled with made-up ids.
+    if (await load_dpp(dpp_id)).missing:
         raise HTTPException(status_code=404, detail="DPP not found")
-    record["id"] = str(record["_id"])
-    record.pop("_id", None)
-    return record
+    options = QROptions(format, box_size, border, error_correction)
+    path = await qr_service.get(dpp_url(dpp_id), options)
+    return FileResponse(path, media_type=MEDIA_TYPES[format], headers=QR_CACHE_HEADERS)
+
+@app.post("/qr/batch")
+async def batch_qr(req: QRBatchRequest, as_zip: bool = Query(False, alias="zip")):
+    if not 1 <= len(req.ids) <= QR_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"ids must contain 1 to {QR_BATCH_MAX} entries")
+    for dpp_id in req.ids:
+        check_dpp_id(dpp_id)
+    oids = [ObjectId(i) for i in req.ids]
+    found = {doc["_id"] async for doc in db.dpps.find({"_id": {"$in": oids}}, {"_id": 1})}
+    missing = [i for i, oid in zip(req.ids, oids) if oid not in found]
+    if missing:
+        shown = ", ".join(missing[:20]) + (", ..." if len(missing) > 20 else "")
+        raise HTTPException(status_code=404, detail=f"DPPs not found: {shown}")
+    options = QROptions(req.format, req.box_size, req.border, req.error_correction)
+    paths = await qr_service.batch([dpp_url(i) for i in req.ids], options)
+
+    if as_zip:
+        entries = [(f"{i}.{req.format}", path) for i, path in zip(req.ids, paths)]
+        return StreamingResponse(
+            iter_zip(entries),
+            media_type="application/zip",
+            headers={"Content-Disposition": 'attachment; filename="qrcodes.zip"'},
+        )
+    query = f"format={req.format}&box_size={req.box_size}&border={req.border}&error_correction={req.error_correction}"
+    return [{"id": i, "qr": f"/dpp/{i}/qr?{query}"} for i in req.ids]
+
+# --- Cache stats ---
+@app.get("/cache/stats")
+async def cache_stats():
+    return dpp_cache.stats()
+
+# --- Metrics (Prometheus text format) ---
+registry.register(CallbackGauge(
+    "dpp_cache", "GET /dpp/{id} response cache counters.",
+    lambda: {(k,): v for k, v in dpp_cache.stats().items()}, ["stat"]))
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 
 # --- Update DPP ---
 @app.put("/dpp/{dpp_id}")
@@ -65,7 +281,9 @@ async def update_dpp(dpp_id: str, dpp: DPP):
         raise HTTPException(status_code=400, detail="Invalid DPP id")
 
     update_data = {k: v for k, v in dpp.dict().items() if v is not None}
-    result = await db.dpps.update_one({"_id": oid}, {"$set": update_data})
+    async with versioned(db, [update_data]):
+        result = await db.dpps.update_one({"_id": oid}, {"$set": update_data})
+    await dpp_cache.invalidate(dpp_id)
 
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="DPP not found")
@@ -79,117 +297,57 @@ async def delete_dpp(dpp_id: str):
         oid = ObjectId(dpp_id)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid DPP id")
-    result = await db.dpps.delete_one({"_id": oid})
+    # The version is reserved before the delete, so a sync reader cannot move
+    # past it while the document is gone but its tombstone is not written yet.
+    mark = {}
+    async with versioned(db, [mark]):
+        result = await db.dpps.delete_one({"_id": oid})
+        if result.deleted_count == 1:
+            await db.dpp_tombstones.update_one(
+                {"_id": oid}, {"$set": {"version": mark["version"], "deleted_at": mark["updated_at"]}}, upsert=True,
+            )
+    await dpp_cache.invalidate(dpp_id)
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="DPP not found")
     return {"message": "DPP deleted", "id": dpp_id}
-# backend/main.py
-from fastapi import FastAPI, UploadFile, File
-import pytesseract
-from PIL import Image
-import io
-import os
-import json
-import openai
-import re
-
-app = FastAPI()
-
-# --- Tesseract setup (Windows default path) ---
-# If you installed tesseract in another location, update the path below.
-pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
-
-# --- OpenAI setup ---
-openai.api_key = os.getenv("OPENAI_API_KEY")  # make sure this env var is set
-
-# --- Prompt / Schema we want the LLM to return ---
-DPP_SCHEMA_PROMPT = """
-You are an assistant that converts messy invoice text into a JSON matching the DPP schema below.
-Return only VALID JSON and nothing else (no explanation, no extra text).
-
-Schema:
-{
-  "product_id": "string or null",
-  "product_name": "string or null",
-  "category": "string or null",
-  "material_composition": "string or null",
-  "batch_number": "string or null",
-  "supplier": {
-    "name": "string or null",
-    "address": "string or null",
-    "contact": "string or null"
-  },
-  "manufacture_date": "string (YYYY-MM-DD) or null",
-  "expiry_date": "string (YYYY-MM-DD) or null",
-  "certifications": ["string", "..."] or [],
-  "sustainability_score": "string or null",
-  "invoice_details": {
-    "invoice_number": "string or null",
-    "invoice_date": "string or null",
-    "quantity": integer or null,
-    "price": float or null,
-    "currency": "string or null"
-  },
-  "traceability": {
-    "origin_country": "string or null",
-    "factory_location": "string or null",
-    "transport_mode": "string or null"
-  }
-}
-
-If a field cannot be found, set it to null (or [] for lists). Use best-effort parsing from the invoice text.
-Invoice text:
-{raw_text}
 
-@app.get("/")
-def home():
-    return {"message": "Hello Econetra - Digital Product Passport API"}
-
-@app.post("/extract-text/")
-async def extract_text(file: UploadFile = File(...)):
-    # 1) Read image bytes and run OCR
-    contents = await file.read()
+# --- Invoice extraction jobs ---
+# OCR and the LLM call run in the background (see extraction.py); clients
+# poll GET /extract-jobs/{id} for the result.
+def submit_extractions(files):
     try:
-        image = Image.open(io.BytesIO(contents))
-    except Exception as e:
-        return {"error": "Uploaded file is not a valid image or cannot be opened.", "details": str(e)}
+        return extraction_pipeline.submit_many(files)
+    except ExtractionError as e:
+        raise HTTPException(status_code=503, detail=str(e))
 
-    raw_text = pytesseract.image_to_string(image)
+@app.post("/extract-jobs", status_code=202)
+async def create_extract_job(file: UploadFile = File(...)):
+    [job] = submit_extractions([(await file.read(), file.filename)])
+    return {"id": job.id, "status": job.status}
 
-    # 2) Prepare final prompt
-    prompt = DPP_SCHEMA_PROMPT.format(raw_text=raw_text)
+@app.post("/extract-jobs/batch", status_code=202)
+async def create_extract_jobs(files: List[UploadFile] = File(...)):
+    # Read every upload first so the batch is either queued whole or refused.
+    jobs = submit_extractions([(await f.read(), f.filename) for f in files])
+    return [{"id": job.id, "filename": job.filename, "status": job.status} for job in jobs]
 
-    # 3) Call OpenAI (chat completion)
-    if not openai.api_key:
-        return {"error": "OPENAI_API_KEY is not set. Set environment variable and restart server.", "raw_text": raw_text}
+@app.get("/extract-cache/stats")
+async def extract_cache_stats():
+    cache = extraction_pipeline.cache
+    return cache.stats() if cache else {}
 
-    try:
-        resp = openai.ChatCompletion.create(
-            model="gpt-4o-mini",   # change model if you prefer
-            messages=[{"role":"user","content": prompt}],
-            temperature=0
-        )
-        llm_text = resp.choices[0].message["content"]
-    except Exception as e:
-        return {"error": "OpenAI API call failed", "details": str(e), "raw_text": raw_text}
+@app.get("/extract-jobs/{job_id}")
+async def get_extract_job(job_id: str):
+    job = extraction_pipeline.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Extraction job not found")
+    return job.as_dict()
 
-    # 4) Try to extract JSON from the LLM response
-    parsed = None
-    try:
-        parsed = json.loads(llm_text)
-    except Exception:
-        # Try to find the first {...} block and parse that
-        m = re.search(r'(\{[\s\S]*\})', llm_text)
-        if m:
-            possible = m.group(1)
-            try:
-                parsed = json.loads(possible)
-            except Exception:
-                parsed = {"raw_llm_output": llm_text}
-        else:
-            parsed = {"raw_llm_output": llm_text}
-
-    return {
-        "raw_text": raw_text,
-        "dpp_json": parsed
-    }
+# Kept for existing clients: waits for the job but no longer blocks the event loop.
+@app.post("/extract-text/")
+async def extract_text(file: UploadFile = File(...)):
+    [job] = submit_extractions([(await file.read(), file.filename)])
+    await asyncio.shield(job.task)
+    if job.status == "failed":
+        return {"error": job.error, **(job.result or {})}
+    return job.result
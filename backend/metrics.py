@@ -0,0 +1,257 @@
+"""Low-overhead request and Mongo metrics, exposed in Prometheus text format."""
+import bisect
+import logging
+import os
+import threading
+import time
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# --- Metric types ---
+# Observations can come from Motor's worker threads as well as the event
+# loop, so updates take a (practically uncontended) lock.
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self.values = {}
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        lines = self.header()
+        for labels, value in list(self.values.items()):
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {_number(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, labels=(), amount=1):
+        self.inc(labels, -amount)
+
+
+class CallbackGauge(Metric):
+    """Gauge read from ``fn() -> {label values: value}`` at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name, help, fn, labels=()):
+        super().__init__(name, help, labels)
+        self.fn = fn
+
+    def render(self):
+        lines = self.header()
+        for labels, value in self.fn().items():
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {_number(value)}")
+        return lines
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (last one is +Inf), sum]
+        self.series = {}
+
+    def observe(self, labels, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    def render(self):
+        lines = self.header()
+        for labels, (counts, total) in list(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {total!r}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template.", ["method", "route", "status"]))
+http_requests_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "HTTP requests currently being served.", ["method"]))
+mongo_command_duration = registry.register(Histogram(
+    "mongo_command_duration_seconds", "MongoDB command duration.", ["command", "collection"]))
+mongo_command_failures = registry.register(Counter(
+    "mongo_command_failures_total", "Failed MongoDB commands.", ["command", "collection"]))
+mongo_pool_wait = registry.register(Histogram(
+    "mongo_pool_wait_seconds", "Time spent waiting to check a connection out of the pool."))
+
+
+# --- HTTP middleware ---
+class MetricsMiddleware:
+    """Pure ASGI middleware, so it adds no per-request task or body copying."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        method = scope["method"]
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc((method,))
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # The router stores the matched route in the scope; using its
+            # template keeps ids out of the label values.
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "<unmatched>"
+            http_request_duration.observe((method, path, str(status)), time.perf_counter() - start)
+            http_requests_in_flight.dec((method,))
+
+
+# --- Mongo command monitoring ---
+def query_shape(value):
+    """The query with every literal replaced by its type name, for logging."""
+    if isinstance(value, dict):
+        return {k: query_shape(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [query_shape(v) for v in value[:3]]
+    return type(value).__name__
+
+
+def _command_filter(command):
+    if "filter" in command:
+        return command["filter"]
+    for key in ("updates", "deletes"):
+        if command.get(key):
+            return command[key][0].get("q")
+    return None
+
+
+class CommandListener(monitoring.CommandListener):
+    def __init__(self, slow_ms=SLOW_QUERY_MS):
+        self.slow_seconds = slow_ms / 1000
+        self._started = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = event.command.get("collection", "")
+        self._started[(event.connection_id, event.request_id)] = (collection, event.command)
+
+    def succeeded(self, event):
+        self._finish(event, failed=False)
+
+    def failed(self, event):
+        self._finish(event, failed=True)
+
+    def _finish(self, event, failed):
+        collection, command = self._started.pop((event.connection_id, event.request_id), ("", None))
+        labels = (event.command_name, collection)
+        duration = event.duration_micros / 1e6
+        mongo_command_duration.observe(labels, duration)
+        if failed:
+            mongo_command_failures.inc(labels)
+        if duration >= self.slow_seconds and command is not None:
+            logger.warning(
+                "Slow Mongo command %s on %s took %.1f ms, filter shape %s",
+                event.command_name, collection or "-", duration * 1000,
+                query_shape(_command_filter(command)),
+            )
+
+
+class PoolListener(monitoring.ConnectionPoolListener):
+    # Check-out start and finish happen on the same driver thread.
+    def __init__(self):
+        self._local = threading.local()
+
+    def connection_check_out_started(self, event):
+        self._local.start = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        start = getattr(self._local, "start", None)
+        if start is not None:
+            mongo_pool_wait.observe((), time.perf_counter() - start)
+            self._local.start = None
+
+    def connection_check_out_failed(self, event):
+        self._local.start = None
+
+    # The remaining pool events are not needed.
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_cleared(self, event): pass
+    def pool_closed(self, event): pass
+    def connection_created(self, event): pass
+    def connection_ready(self, event): pass
+    def connection_closed(self, event): pass
+    def connection_checked_in(self, event): pass
@@ -5,6 +5,7 @@ class Supplier(BaseModel):
     name: str
     address: Optional[str] = None
     contact: Optional[str] = None
+    gstin: Optional[str] = None
 
 class InvoiceDetails(BaseModel):
     invoice_number: Optional[str] = None
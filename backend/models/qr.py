@@ -0,0 +1,9 @@
+from pydantic import BaseModel, Field
+from typing import List, Literal
+
+class QRBatchRequest(BaseModel):
+    ids: List[str]
+    format: Literal["png", "svg"] = "png"
+    box_size: int = Field(10, ge=1, le=50)
+    border: int = Field(4, ge=0, le=20)
+    error_correction: Literal["L", "M", "Q", "H"] = "M"
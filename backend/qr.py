@@ -0,0 +1,225 @@
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import os
+import time
+import zipfile
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import qrcode
+import qrcode.image.svg
+
+DPP_PUBLIC_URL = os.getenv("DPP_PUBLIC_URL", "http://localhost:8000")
+QR_CACHE_DIR = os.getenv("QR_CACHE_DIR", "qrcodes/cache")
+QR_WORKERS = int(os.getenv("QR_WORKERS", str(os.cpu_count() or 1)))
+# Least recently used codes are deleted once the cache grows past this.
+QR_CACHE_MAX_BYTES = int(os.getenv("QR_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+# The cache size is checked after every this many newly rendered codes.
+QR_PRUNE_EVERY = int(os.getenv("QR_PRUNE_EVERY", "1000"))
+# Reads refresh a cached file's atime at most this often (seconds).
+ATIME_RESOLUTION = 3600
+
+logger = logging.getLogger(__name__)
+
+ERROR_CORRECTION = {
+    "L": qrcode.constants.ERROR_CORRECT_L,
+    "M": qrcode.constants.ERROR_CORRECT_M,
+    "Q": qrcode.constants.ERROR_CORRECT_Q,
+    "H": qrcode.constants.ERROR_CORRECT_H,
+}
+MEDIA_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
+
+QROptions = namedtuple("QROptions", ["format", "box_size", "border", "error_correction"])
+
+
+def dpp_url(dpp_id):
+    return f"{DPP_PUBLIC_URL}/dpp/{dpp_id}"
+
+
+def cache_path(url, options):
+    """Content-addressed location of the rendered code for (url, options)."""
+    key = json.dumps([url, *options], separators=(",", ":"))
+    digest = hashlib.sha256(key.encode()).hexdigest()
+    return os.path.join(QR_CACHE_DIR, digest[:2], f"{digest}.{options.format}")
+
+
+def touch(path):
+    """Whether ``path`` is cached; marks it as recently used for pruning.
+
+    The atime is set explicitly because many filesystems are mounted with
+    noatime or relatime.
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return False
+    now = time.time()
+    if now - st.st_atime > ATIME_RESOLUTION:
+        try:
+            os.utime(path, (now, st.st_mtime))
+        except OSError:
+            pass
+    return True
+
+
+def prune_cache(directory, max_bytes):
+    """Delete least recently used codes until the cache is under 90% of ``max_bytes``."""
+    files = []
+    total = 0
+    for root, _, names in os.walk(directory):
+        for name in names:
+            if name.endswith(".tmp"):
+                continue  # being written by a worker
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((st.st_atime, st.st_size, path))
+            total += st.st_size
+    if total <= max_bytes:
+        return 0
+    files.sort()
+    # Trim to 90% so a full cache does not prune after every batch.
+    target = max_bytes * 0.9
+    removed = 0
+    for _, size, path in files:
+        if total <= target:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    return removed
+
+
+def render(url, options):
+    code = qrcode.QRCode(
+        box_size=options.box_size,
+        border=options.border,
+        error_correction=ERROR_CORRECTION[options.error_correction],
+        image_factory=qrcode.image.svg.SvgPathImage if options.format == "svg" else None,
+    )
+    code.add_data(url)
+    code.make(fit=True)
+    out = io.BytesIO()
+    code.make_image().save(out)
+    return out.getvalue()
+
+
+def render_to_cache(urls, options):
+    """Render every url not already cached; runs inside a pool worker."""
+    paths = []
+    for url in urls:
+        path = cache_path(url, options)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename so readers never see a partial file.
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(render(url, options))
+            os.replace(tmp, path)
+        paths.append(path)
+    return paths
+
+
+class QRService:
+    """Renders QR codes in a process pool, off the event loop, into the on-disk cache."""
+
+    def __init__(self, workers=QR_WORKERS, max_bytes=QR_CACHE_MAX_BYTES, prune_every=QR_PRUNE_EVERY):
+        self.workers = workers
+        self.max_bytes = max_bytes
+        self.prune_every = prune_every
+        self._pool = None
+        # Starting at the threshold makes the first render after startup check the cache size.
+        self._rendered = prune_every
+        self._pruning = None
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    async def get(self, url, options):
+        path = cache_path(url, options)
+        if touch(path):
+            return path
+        loop = asyncio.get_running_loop()
+        paths = await loop.run_in_executor(self.pool, render_to_cache, [url], options)
+        self._count_rendered(1)
+        return paths[0]
+
+    async def batch(self, urls, options):
+        """Paths for all urls, in order; uncached ones are rendered in chunks across the pool."""
+        missing = [url for url in urls if not touch(cache_path(url, options))]
+        if missing:
+            # A few chunks per worker keeps them all busy without per-code IPC overhead.
+            size = max(1, min(256, -(-len(missing) // (self.workers * 4))))
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*[
+                loop.run_in_executor(self.pool, render_to_cache, missing[i:i + size], options)
+                for i in range(0, len(missing), size)
+            ])
+            self._count_rendered(len(missing))
+        return [cache_path(url, options) for url in urls]
+
+    def _count_rendered(self, n):
+        self._rendered += n
+        if self._rendered >= self.prune_every and (self._pruning is None or self._pruning.done()):
+            self._rendered = 0
+            self._pruning = asyncio.create_task(self._prune())
+
+    async def _prune(self):
+        try:
+            removed = await asyncio.to_thread(prune_cache, QR_CACHE_DIR, self.max_bytes)
+            if removed:
+                logger.info("Pruned %d QR codes from the cache", removed)
+        except Exception:
+            logger.exception("Pruning the QR cache failed")
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+
+class _ZipBuffer:
+    # Write-only sink for ZipFile; it falls back to data descriptors when it cannot seek.
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_zip(entries):
+    """Yield a ZIP archive of (name, path) files piece by piece.
+
+    This is a plain generator so StreamingResponse runs it, and its file
+    reads, in a worker thread.
+    """
+    buf = _ZipBuffer()
+    # Codes are already compressed (PNG) or tiny (SVG), so store them as-is.
+    with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_STORED) as archive:
+        for name, path in entries:
+            archive.write(path, name)
+            yield buf.take()
+    yield buf.take()
+
+
+qr_service = QRService()
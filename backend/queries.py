@@ -0,0 +1,66 @@
+import base64
+import binascii
+import re
+
+from bson.objectid import ObjectId
+
+from models.dpp import DPP
+
+# Query parameter -> document field for the equality filters GET /dpp supports.
+# Each of these has a matching (field, _id desc) index in database.ensure_indexes.
+FILTER_FIELDS = {
+    "product_id": "product_id",
+    "category": "category",
+    "batch_number": "batch_number",
+    "supplier_name": "supplier.name",
+    "compliance_status": "compliance_status",
+}
+
+NESTED_FIELDS = {"supplier", "invoice_details", "traceability"}
+_SUBFIELD = re.compile(r"^[A-Za-z0-9_]+$")
+
+
+class QueryError(ValueError):
+    pass
+
+
+def build_filter(params):
+    """Mongo filter from the supported query parameters, skipping unset ones."""
+    return {field: params[name] for name, field in FILTER_FIELDS.items() if params.get(name) is not None}
+
+
+# --- Keyset cursors ---
+# The cursor is the last returned _id, base64 encoded so clients treat it as opaque.
+def encode_cursor(oid):
+    return base64.urlsafe_b64encode(oid.binary).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        return ObjectId(raw)
+    except (binascii.Error, ValueError, TypeError):
+        raise QueryError("Invalid cursor")
+
+
+def page_filter(query, cursor):
+    if cursor:
+        return {**query, "_id": {"$lt": decode_cursor(cursor)}}
+    return query
+
+
+# --- Projection ---
+def build_projection(fields):
+    """Projection for a comma separated ``fields=`` value, e.g. ``product_id,supplier.name``."""
+    if not fields:
+        return None
+    projection = {}
+    for name in fields.split(","):
+        name = name.strip()
+        if not name or name == "id":
+            continue
+        top, _, sub = name.partition(".")
+        if top not in DPP.__fields__ or (sub and (top not in NESTED_FIELDS or not _SUBFIELD.match(sub))):
+            raise QueryError(f"Unknown field: {name}")
+        projection[name] = 1
+    return projection or {"_id": 1}
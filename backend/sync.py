@@ -0,0 +1,237 @@
+"""Version stamps, tombstones and the change feed behind GET /dpp/changes.
+
+Every write takes the next value of a single counter as the document's
+``version`` (deletes store it in a tombstone), so a client that remembers
+the last version it saw can ask for just what changed since.
+
+A version is reserved before its write lands, so a later version can be
+visible first. While a write is in flight its versions are listed as
+pending on the counter document, and the feed stops just below the oldest
+pending version; a client therefore never moves past a write that has not
+landed yet, however long the write takes.
+"""
+import asyncio
+import base64
+import binascii
+import json
+import logging
+import os
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+
+from bson.objectid import ObjectId
+from fastapi.encoders import jsonable_encoder
+from pymongo import ReturnDocument, UpdateOne
+
+logger = logging.getLogger(__name__)
+
+VERSION_COUNTER = "dpp_version"
+SYNC_PAGE_LIMIT = int(os.getenv("SYNC_PAGE_LIMIT", "500"))
+SYNC_POLL_SECONDS = float(os.getenv("SYNC_POLL_SECONDS", "2"))
+# A pending reservation older than this is taken to belong to a crashed
+# worker and no longer holds the feed back. Must exceed the slowest write
+# (a full POST /dpp/bulk batch).
+SYNC_LEASE_SECONDS = float(os.getenv("SYNC_LEASE_SECONDS", "300"))
+# How soon SSE streams look again when the feed was held back by a pending write.
+SYNC_RETRY_SECONDS = 0.2
+
+
+class TokenError(ValueError):
+    pass
+
+
+def encode_token(version):
+    return base64.urlsafe_b64encode(f"v{version}".encode()).decode().rstrip("=")
+
+
+def decode_token(token):
+    if not token:
+        return 0
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+        if raw[:1] != "v":
+            raise ValueError
+        return int(raw[1:])
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise TokenError("Invalid sync token")
+
+
+def utcnow():
+    return datetime.now(timezone.utc)
+
+
+def _aware(value):
+    # Mongo hands datetimes back naive (in UTC).
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+# --- Stamping writes ---
+@asynccontextmanager
+async def versioned(db, docs):
+    """Give each of ``docs`` its own version and the current time for the write in the block.
+
+    The versions are reserved together with a pending entry on the counter
+    (one atomic update), and the entry is removed when the block exits.
+    """
+    lease = ObjectId()
+    now = utcnow()
+    counter = await db.counters.find_one_and_update(
+        {"_id": VERSION_COUNTER},
+        # A pipeline update, so the pending entry can record the first version it reserves.
+        [{"$set": {
+            "value": {"$add": [{"$ifNull": ["$value", 0]}, len(docs)]},
+            "pending": {"$concatArrays": [
+                {"$ifNull": ["$pending", []]},
+                [{"id": lease, "first": {"$add": [{"$ifNull": ["$value", 0]}, 1]}, "at": now}],
+            ]},
+        }}],
+        projection={"value": 1}, upsert=True, return_document=ReturnDocument.AFTER,
+    )
+    first = counter["value"] - len(docs) + 1
+    for i, doc in enumerate(docs):
+        doc["version"] = first + i
+        doc["updated_at"] = now
+    try:
+        yield docs
+    finally:
+        await db.counters.update_one({"_id": VERSION_COUNTER}, {"$pull": {"pending": {"id": lease}}})
+
+
+async def expire_leases(db):
+    """Drop pending entries left by workers that died mid-write."""
+    cutoff = utcnow() - timedelta(seconds=SYNC_LEASE_SECONDS)
+    await db.counters.update_one({"_id": VERSION_COUNTER}, {"$pull": {"pending": {"at": {"$lt": cutoff}}}})
+
+
+async def backfill_versions(db, batch_size=1000):
+    """Version documents written before versioning existed; a no-op once done."""
+    total = 0
+    while True:
+        docs = [d async for d in db.dpps.find({"version": None}, {"_id": 1}).limit(batch_size)]
+        if not docs:
+            break
+        async with versioned(db, docs):
+            await db.dpps.bulk_write([
+                UpdateOne({"_id": d["_id"]}, {"$set": {"version": d["version"], "updated_at": d["updated_at"]}})
+                for d in docs
+            ], ordered=False)
+        total += len(docs)
+    if total:
+        logger.info("Backfilled versions on %d DPPs", total)
+
+
+# --- Reading changes ---
+async def visible_version(db):
+    """The highest version below which every write has landed."""
+    counter = await db.counters.find_one({"_id": VERSION_COUNTER}) or {}
+    cutoff = utcnow() - timedelta(seconds=SYNC_LEASE_SECONDS)
+    pending = [p["first"] - 1 for p in counter.get("pending", []) if _aware(p["at"]) > cutoff]
+    return min([counter.get("value", 0), *pending])
+
+
+async def latest_token(db):
+    """Token for "now", to start delta syncs from after a full load."""
+    return encode_token(await visible_version(db))
+
+
+async def changes_since(db, since, limit=SYNC_PAGE_LIMIT):
+    """Changed documents and deleted ids with a version above ``since``, oldest first."""
+    # Read the counter first: anything newer may have been written around a pending write.
+    visible = await visible_version(db)
+    query = {"version": {"$gt": since}}
+    changed = db.dpps.find(query).sort([("version", 1)]).limit(limit + 1)
+    deleted = db.dpp_tombstones.find(query).sort([("version", 1)]).limit(limit + 1)
+    entries = [(d["version"], d) async for d in changed]
+    entries += [(d["version"], {"_id": d["_id"], "deleted": True}) async for d in deleted]
+    entries.sort(key=lambda e: e[0])
+
+    # has_more: another page is ready now; settling: newer changes will be
+    # returned once the writes still in flight before them have landed.
+    result = {"changed": [], "deleted": [], "has_more": False, "settling": False}
+    version = since
+    for i, (entry_version, doc) in enumerate(entries):
+        if i == limit:
+            result["has_more"] = True
+            break
+        if entry_version > visible:
+            result["settling"] = True
+            break
+        version = entry_version
+        doc_id = str(doc.pop("_id"))
+        if doc.get("deleted"):
+            result["deleted"].append(doc_id)
+        else:
+            doc["id"] = doc_id
+            result["changed"].append(doc)
+    result["next"] = encode_token(version)
+    return result
+
+
+class ChangeNotifier:
+    """Wakes SSE subscribers when the collection changes.
+
+    One Mongo change stream is shared by all subscribers. Standalone servers
+    have no change streams, so subscribers then fall back to polling every
+    SYNC_POLL_SECONDS.
+    """
+
+    def __init__(self):
+        self.subscribers = set()
+        self._task = None
+
+    def subscribe(self):
+        event = asyncio.Event()
+        self.subscribers.add(event)
+        return event
+
+    def unsubscribe(self, event):
+        self.subscribers.discard(event)
+
+    def start(self, db):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._watch(db))
+
+    async def _watch(self, db):
+        pipeline = [{"$match": {"ns.coll": {"$in": ["dpps", "dpp_tombstones"]}}}]
+        try:
+            async with db.watch(pipeline) as stream:
+                async for _ in stream:
+                    for event in list(self.subscribers):
+                        event.set()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.info("Change streams unavailable (%s); SSE clients will poll", e)
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+notifier = ChangeNotifier()
+
+
+async def change_events(db, since, request):
+    """Server-sent events carrying the same payload as GET /dpp/changes."""
+    notifier.start(db)
+    wake = notifier.subscribe()
+    try:
+        while not await request.is_disconnected():
+            batch = await changes_since(db, since)
+            if batch["changed"] or batch["deleted"]:
+                since = decode_token(batch["next"])
+                payload = json.dumps(jsonable_encoder(batch), separators=(",", ":"))
+                yield f"id: {batch['next']}\nevent: changes\ndata: {payload}\n\n"
+            if batch["has_more"]:
+                continue
+            if batch["settling"]:
+                await asyncio.sleep(SYNC_RETRY_SECONDS)
+                continue
+            try:
+                await asyncio.wait_for(wake.wait(), SYNC_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+            wake.clear()
+    finally:
+        notifier.unsubscribe(wake)
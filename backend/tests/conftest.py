@@ -0,0 +1,48 @@
+import asyncio
+import os
+import sys
+
+import httpx
+import pytest
+
+# Backend modules import each other as top-level modules (``from database import db``).
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.memory_db import MemoryDatabase  # noqa: E402
+from cache import LocalBackend, ResponseCache  # noqa: E402
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def aiter_of(*items):
+    for item in items:
+        yield item
+
+
+async def collect(agen):
+    return [item async for item in agen]
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """Point the app at a fresh in-memory database and response cache."""
+    import main
+
+    memory_db = MemoryDatabase()
+    monkeypatch.setattr(main, "db", memory_db)
+    monkeypatch.setattr(main, "dpp_cache", ResponseCache(LocalBackend()))
+    return memory_db
+
+
+def call(method, url, **kwargs):
+    """One request against the ASGI app, without a server."""
+    import main
+
+    async def send():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.request(method, url, **kwargs)
+
+    return run(send())
@@ -0,0 +1,124 @@
+from conftest import call, run
+
+from cache import CachedResponse, LocalBackend, ResponseCache, make_etag
+
+
+def test_hit_after_set():
+    cache = ResponseCache(LocalBackend())
+    entry, generation = run(cache.get("a"))
+    assert entry is None
+    run(cache.set("a", b'{"x":1}', generation))
+    entry, _ = run(cache.get("a"))
+    assert entry.body == b'{"x":1}'
+    assert entry.etag == make_etag(b'{"x":1}')
+    assert cache.stats()["hits"] == 1
+
+
+def test_missing_documents_are_cached_as_negative_entries():
+    cache = ResponseCache(LocalBackend())
+    _, generation = run(cache.get("a"))
+    run(cache.set("a", None, generation))
+    entry, _ = run(cache.get("a"))
+    assert entry.missing
+    assert cache.stats()["negative_hits"] == 1
+
+
+def test_invalidate_removes_the_entry():
+    cache = ResponseCache(LocalBackend())
+    _, generation = run(cache.get("a"))
+    run(cache.set("a", b"old", generation))
+    run(cache.invalidate("a"))
+    assert run(cache.get("a"))[0] is None
+
+
+def test_read_that_raced_an_update_is_not_cached():
+    cache = ResponseCache(LocalBackend())
+    _, generation = run(cache.get("a"))
+    # An update lands between this reader's DB read and its set.
+    run(cache.invalidate("a"))
+    entry = run(cache.set("a", b"old", generation))
+    assert entry.body == b"old"
+    assert run(cache.get("a"))[0] is None
+
+
+def test_generation_guard_holds_across_workers_sharing_a_backend():
+    shared = LocalBackend()
+    reader, writer = ResponseCache(shared), ResponseCache(shared)
+    _, generation = run(reader.get("a"))
+    run(writer.invalidate("a"))
+    run(reader.set("a", b"old", generation))
+    assert run(reader.get("a"))[0] is None
+    assert run(writer.get("a"))[0] is None
+
+
+def test_invalidating_one_key_does_not_drop_fills_of_others():
+    cache = ResponseCache(LocalBackend())
+    _, generation = run(cache.get("a"))
+    run(cache.invalidate("b"))
+    run(cache.set("a", b"body", generation))
+    assert run(cache.get("a"))[0].body == b"body"
+
+
+def test_generation_table_is_bounded():
+    backend = LocalBackend(max_entries=2)
+    cache = ResponseCache(backend)
+    _, generation = run(cache.get("a"))
+    for key in "bcd":
+        run(cache.invalidate(key))
+    # The table overflowed and was reset, so older reads are all discarded.
+    assert len(backend._generations) <= 2
+    run(cache.set("a", b"body", generation))
+    assert run(cache.get("a"))[0] is None
+
+
+def test_invalidation_on_one_worker_is_seen_by_another():
+    shared = LocalBackend()
+    reader, writer = ResponseCache(shared), ResponseCache(shared)
+    _, generation = run(reader.get("a"))
+    run(reader.set("a", b"old", generation))
+    run(writer.invalidate("a"))
+    assert run(reader.get("a"))[0] is None
+
+
+def test_expired_entries_are_misses():
+    cache = ResponseCache(LocalBackend(), ttl=-1)
+    _, generation = run(cache.get("a"))
+    run(cache.set("a", b"body", generation))
+    assert run(cache.get("a"))[0] is None
+
+
+def test_lru_bounds():
+    backend = LocalBackend(max_entries=2, max_bytes=10)
+    run(backend.set("a", b"1234", 60, (0, 0)))
+    run(backend.set("b", b"1234", 60, (0, 0)))
+    run(backend.get("a"))
+    run(backend.set("c", b"1234", 60, (0, 0)))
+    assert run(backend.get("b"))[0] is None
+    assert run(backend.get("a"))[0] == b"1234"
+    run(backend.set("d", b"12345678", 60, (0, 0)))
+    assert len(backend) == 1 and backend.size == 8
+    run(backend.set("e", b"x" * 11, 60, (0, 0)))
+    assert run(backend.get("e"))[0] is None
+
+
+def test_serialized_entry_round_trip():
+    entry = CachedResponse(b'{"a": "b c"}', make_etag(b'{"a": "b c"}'))
+    again = CachedResponse.from_bytes(entry.to_bytes())
+    assert (again.body, again.etag) == (entry.body, entry.etag)
+    assert CachedResponse.from_bytes(b"").missing
+
+
+def test_get_dpp_serves_etags_and_sees_updates(db):
+    dpp_id = call("POST", "/dpp", json={"product_id": "P-1"}).json()["id"]
+    first = call("GET", f"/dpp/{dpp_id}")
+    assert first.json()["product_id"] == "P-1"
+    etag = first.headers["ETag"]
+    assert call("GET", f"/dpp/{dpp_id}", headers={"If-None-Match": etag}).status_code == 304
+
+    call("PUT", f"/dpp/{dpp_id}", json={"product_id": "P-2"})
+    second = call("GET", f"/dpp/{dpp_id}", headers={"If-None-Match": etag})
+    assert second.status_code == 200
+    assert second.json()["product_id"] == "P-2"
+
+    call("DELETE", f"/dpp/{dpp_id}")
+    assert call("GET", f"/dpp/{dpp_id}").status_code == 404
@@ -0,0 +1,223 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from conftest import call, run
+
+import main
+from extraction import Completion, ExtractionError, ExtractionPipeline, PROMPT_VERSION, parse_llm_output
+from extraction_cache import ExtractionCache
+from invoice_rules import TemplateRegistry, extract_fields
+
+INVOICE_TEXT = "Tax Invoice\nAcme Widgets\nWidget A  Qty: 10\nGrand Total: Rs. 1,250.00"
+LLM_REPLY = json.dumps({
+    "product_name": "Widget A",
+    "supplier": {"name": "Acme Widgets"},
+    "invoice_details": {"quantity": 10, "price": 1250.0, "currency": "INR"},
+})
+
+
+class FakeLLM:
+    """Stands in for OpenAIClient; records prompts and replies with canned text."""
+
+    def __init__(self, reply=LLM_REPLY, delay=0.0, error=None):
+        self.reply = reply
+        self.delay = delay
+        self.error = error
+        self.prompts = []
+
+    async def complete(self, prompt, model):
+        self.prompts.append(prompt)
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return Completion(self.reply, tokens=42)
+
+
+class FakeOCR:
+    # Called from the executor's worker threads.
+    def __init__(self, text=INVOICE_TEXT, delay=0.0):
+        self.text = text
+        self.delay = delay
+        self.calls = 0
+
+    def __call__(self, contents):
+        self.calls += 1
+        time.sleep(self.delay)
+        return self.text
+
+
+def make_pipeline(llm=None, ocr=None, **kwargs):
+    return ExtractionPipeline(
+        llm=llm or FakeLLM(), ocr=ocr or FakeOCR(), executor=ThreadPoolExecutor(2), **kwargs
+    )
+
+
+async def finish(pipeline, contents=b"scan", filename="a.png"):
+    job = pipeline.submit(contents, filename)
+    await job.task
+    return job
+
+
+def test_job_runs_ocr_then_llm():
+    llm = FakeLLM()
+
+    async def scenario():
+        pipeline = make_pipeline(llm)
+        job = await finish(pipeline)
+        assert pipeline.get(job.id) is job
+        assert pipeline.pending == 0
+        return job
+
+    job = run(scenario())
+    assert job.status == "done", job.error
+    assert job.result["raw_text"] == INVOICE_TEXT
+    assert job.result["dpp_json"]["product_name"] == "Widget A"
+    # Confident rule values fill what the LLM left out.
+    assert job.result["confidence"]["invoice_details.price"] >= 0.7
+    assert INVOICE_TEXT in llm.prompts[0]
+    assert job.as_dict()["finished_at"] >= job.as_dict()["created_at"]
+
+
+def test_unparseable_llm_reply_is_returned_raw():
+    job = run(finish(make_pipeline(FakeLLM(reply="Sorry, I can't help with that."))))
+    assert job.status == "done"
+    assert job.result["dpp_json"]["raw_llm_output"] == "Sorry, I can't help with that."
+
+
+def test_llm_error_fails_the_job():
+    job = run(finish(make_pipeline(FakeLLM(error=RuntimeError("rate limited")))))
+    assert job.status == "failed"
+    assert job.error == "rate limited"
+    assert job.result["raw_text"] == INVOICE_TEXT
+
+
+def test_ocr_timeout():
+    job = run(finish(make_pipeline(ocr=FakeOCR(delay=0.3), ocr_timeout=0.05)))
+    assert (job.status, job.error) == ("failed", "OCR step timed out")
+
+
+def test_llm_timeout():
+    job = run(finish(make_pipeline(FakeLLM(delay=0.3), llm_timeout=0.05)))
+    assert (job.status, job.error) == ("failed", "LLM step timed out")
+
+
+def test_too_many_pending_jobs_are_refused():
+    async def scenario():
+        pipeline = make_pipeline(FakeLLM(delay=0.1), max_pending=2)
+        jobs = [pipeline.submit(b"a"), pipeline.submit(b"b")]
+        with pytest.raises(ExtractionError):
+            pipeline.submit(b"c")
+        await asyncio.gather(*(j.task for j in jobs))
+        pipeline.submit(b"d")
+
+    run(scenario())
+
+
+def test_batch_that_does_not_fit_is_refused_whole():
+    async def scenario():
+        pipeline = make_pipeline(FakeLLM(delay=0.1), max_pending=3)
+        first = pipeline.submit(b"a")
+        with pytest.raises(ExtractionError):
+            pipeline.submit_many([(b"b", "b.png"), (b"c", "c.png"), (b"d", "d.png")])
+        assert list(pipeline.jobs) == [first.id] and pipeline.pending == 1
+        jobs = pipeline.submit_many([(b"b", "b.png"), (b"c", "c.png")])
+        assert [j.filename for j in jobs] == ["b.png", "c.png"]
+        await asyncio.gather(first.task, *(j.task for j in jobs))
+
+    run(scenario())
+
+
+def test_batch_endpoint_queues_nothing_when_over_capacity(monkeypatch):
+    pipeline = make_pipeline(max_pending=2)
+    monkeypatch.setattr(main, "extraction_pipeline", pipeline)
+    files = [("files", (f"{i}.png", b"scan", "image/png")) for i in range(3)]
+    resp = call("POST", "/extract-jobs/batch", files=files)
+    assert resp.status_code == 503
+    assert pipeline.jobs == {} and pipeline.pending == 0
+
+
+def test_llm_calls_are_bounded_by_concurrency():
+    class CountingLLM(FakeLLM):
+        active = peak = 0
+
+        async def complete(self, prompt, model):
+            CountingLLM.active += 1
+            CountingLLM.peak = max(CountingLLM.peak, CountingLLM.active)
+            try:
+                return await super().complete(prompt, model)
+            finally:
+                CountingLLM.active -= 1
+
+    async def scenario():
+        pipeline = make_pipeline(CountingLLM(delay=0.02), llm_concurrency=2)
+        jobs = [pipeline.submit(str(i).encode()) for i in range(6)]
+        await asyncio.gather(*(j.task for j in jobs))
+        return jobs
+
+    jobs = run(scenario())
+    assert all(j.status == "done" for j in jobs)
+    assert CountingLLM.peak == 2
+
+
+def test_cache_skips_repeated_ocr_and_llm(tmp_path):
+    llm, ocr = FakeLLM(), FakeOCR()
+    cache = ExtractionCache(str(tmp_path / "cache.sqlite3"), prompt_version=PROMPT_VERSION)
+
+    async def scenario():
+        pipeline = make_pipeline(llm, ocr, cache=cache)
+        first = await finish(pipeline, b"same scan")
+        second = await finish(pipeline, b"same scan")
+        pipeline.shutdown()
+        return first, second
+
+    first, second = run(scenario())
+    assert first.result == second.result
+    assert (ocr.calls, len(llm.prompts)) == (1, 1)
+    stats = cache.stats()
+    assert stats["ocr"]["hits"] == 1 and stats["llm"]["tokens_saved"] == 42
+
+
+def test_extract_jobs_endpoints(monkeypatch):
+    pipeline = make_pipeline()
+    monkeypatch.setattr(main, "extraction_pipeline", pipeline)
+
+    resp = call("POST", "/extract-text/", files={"file": ("a.png", b"scan", "image/png")})
+    assert resp.status_code == 200
+    assert resp.json()["dpp_json"]["product_name"] == "Widget A"
+    assert call("GET", "/extract-jobs/nope").status_code == 404
+
+
+@pytest.mark.parametrize("reply", ["null", "[1, 2]", '"text"', "42", ""])
+def test_llm_replies_that_are_not_objects_are_returned_raw(reply):
+    job = run(finish(make_pipeline(FakeLLM(reply=reply))))
+    assert job.status == "done", job.error
+    assert job.result["dpp_json"]["raw_llm_output"] == reply
+
+
+def test_json_object_is_found_inside_chatty_replies():
+    assert parse_llm_output('Here you go:\n```json\n{"product_name": "X"}\n```') == {"product_name": "X"}
+    assert parse_llm_output("[1, 2]") == {"raw_llm_output": "[1, 2]"}
+
+
+def test_template_fields_survive_a_failed_llm_call(tmp_path, monkeypatch):
+    (tmp_path / "acme.json").write_text(json.dumps({
+        "match": {"pattern": "ACME"},
+        "fields": {"invoice_details.invoice_number": "Bill Ref\\s*(\\S+)"},
+        "required": ["supplier.name", "invoice_details.invoice_number"],
+    }))
+    monkeypatch.setattr("extraction.extract_fields", lambda text: extract_fields(text, TemplateRegistry(str(tmp_path))))
+
+    llm = FakeLLM(error=ExtractionError("OPENAI_API_KEY is not set."))
+    job = run(finish(make_pipeline(llm, FakeOCR("ACME\nBill Ref acme/778"))))
+    assert job.status == "done"
+    assert job.result["error"] == "OPENAI_API_KEY is not set."
+    assert job.result["llm_fields"] == ["supplier.name"]
+    assert job.result["dpp_json"] == {"invoice_details": {"invoice_number": "acme/778"}}
+
+    slow = make_pipeline(FakeLLM(delay=1), FakeOCR("ACME\nBill Ref acme/778"), llm_timeout=0.01)
+    job = run(finish(slow))
+    assert job.status == "done"
+    assert job.result["error"] == "LLM step timed out"
@@ -0,0 +1,144 @@
+from contextlib import asynccontextmanager
+
+from conftest import aiter_of, collect, run
+
+import ingest
+from benchmarks.memory_db import MemoryDatabase
+from ingest import RecordError, bulk_insert, iter_json_array, iter_ndjson, iter_records
+
+
+def parse(parser, *chunks):
+    return run(collect(parser(aiter_of(*chunks))))
+
+
+def errors(items):
+    return [(pos, str(obj)) for pos, obj in items if isinstance(obj, RecordError)]
+
+
+# --- NDJSON ---
+def test_ndjson_lines_split_across_chunks():
+    items = parse(iter_ndjson, b'{"a": 1}\n{"a"', b': 2}\n\n{"a": 3', b"}")
+    assert items == [(1, {"a": 1}), (2, {"a": 2}), (4, {"a": 3})]
+
+
+def test_ndjson_bad_line_does_not_stop_the_stream():
+    items = parse(iter_ndjson, b'{"a": 1}\nnot json\n{"a": 3}\n')
+    assert [pos for pos, _ in errors(items)] == [2]
+    assert items[2] == (3, {"a": 3})
+
+
+def test_ndjson_oversized_line_is_skipped_up_to_the_next_newline(monkeypatch):
+    monkeypatch.setattr(ingest, "MAX_RECORD_BYTES", 16)
+    big = b'{"a": "' + b"x" * 40 + b'"}'
+    items = parse(iter_ndjson, b'{"a": 1}\n', big[:20], big[20:40], big[40:] + b'\n{"a": 3}\n')
+    assert items[0] == (1, {"a": 1})
+    assert errors(items) == [(2, "record exceeds 16 bytes")]
+    assert items[-1] == (3, {"a": 3})
+    assert len(items) == 3
+
+
+def test_ndjson_oversized_last_line_without_newline(monkeypatch):
+    monkeypatch.setattr(ingest, "MAX_RECORD_BYTES", 16)
+    items = parse(iter_ndjson, b'{"a": 1}\n', b"y" * 20, b"y" * 20)
+    assert items[0] == (1, {"a": 1})
+    assert errors(items) == [(2, "record exceeds 16 bytes")]
+    assert len(items) == 2
+
+
+# --- JSON array ---
+def test_array_elements_split_across_chunks():
+    items = parse(iter_json_array, b' [ {"a": 1},', b'{"a"', b": 2} , ", b'{"a": 3}]')
+    assert items == [(0, {"a": 1}), (1, {"a": 2}), (2, {"a": 3})]
+
+
+def test_array_multibyte_character_split_across_chunks():
+    raw = '[{"name": "Café"}]'.encode()
+    cut = raw.index("é".encode()) + 1
+    assert parse(iter_json_array, raw[:cut], raw[cut:]) == [(0, {"name": "Café"})]
+
+
+def test_array_empty():
+    assert parse(iter_json_array, b"[", b"  ]") == []
+
+
+def test_array_unterminated():
+    items = parse(iter_json_array, b'[{"a": 1},')
+    assert items[0] == (0, {"a": 1})
+    assert errors(items) == [(1, "unterminated JSON array")]
+
+
+def test_array_broken_element_ends_the_stream():
+    items = parse(iter_json_array, b'[{"a": 1}, {"a": }, {"a": 3}]')
+    assert items[0] == (0, {"a": 1})
+    assert len(items) == 2
+    assert errors(items)[0][0] == 1
+
+
+def test_array_oversized_element(monkeypatch):
+    monkeypatch.setattr(ingest, "MAX_RECORD_BYTES", 16)
+    items = parse(iter_json_array, b'[{"a": 1}, {"a": "', *[b"x" * 10] * 5, b'"}]')
+    assert items[0] == (0, {"a": 1})
+    assert len(items) == 2
+    assert errors(items)[0][0] == 1
+
+
+def test_array_rejects_other_top_level_values():
+    assert errors(parse(iter_json_array, b'{"a": 1}')) == [(0, "body must be a JSON array or NDJSON")]
+
+
+# --- Format sniffing and insert ---
+def test_iter_records_sniffs_the_format():
+    async def sniff(*chunks):
+        key, records = await iter_records(aiter_of(*chunks))
+        return key, await collect(records)
+
+    assert run(sniff(b"\n  ", b'[{"a": 1}]')) == ("index", [(0, {"a": 1})])
+    assert run(sniff(b'{"a": 1}\n')) == ("line", [(1, {"a": 1})])
+
+
+def test_body_that_arrives_in_a_single_chunk():
+    async def parse_body(body):
+        _, records = await iter_records(aiter_of(body))
+        return await collect(records)
+
+    assert run(parse_body(b'{"a": 1}\n{"a": 2}\n')) == [(1, {"a": 1}), (2, {"a": 2})]
+    assert run(parse_body(b'{"a": 1}\n{"a": 2}')) == [(1, {"a": 1}), (2, {"a": 2})]
+    assert run(parse_body(b'[{"a": 1}, {"a": 2}]')) == [(0, {"a": 1}), (1, {"a": 2})]
+
+
+def test_bulk_insert_reports_failures_by_position():
+    db = MemoryDatabase()
+    body = b"\n".join([
+        b'{"product_id": "P-1"}',
+        b'{"product_id": "P-2", "supplier": {"address": "no name"}}',
+        b"[1, 2]",
+        b"{oops",
+        b'{"product_id": "P-5"}',
+    ])
+    report = run(bulk_insert(db.dpps, aiter_of(body[:30], body[30:]), batch_size=1))
+    assert report["received"] == 5
+    assert report["inserted"] == 2
+    assert [e["line"] for e in report["errors"]] == [2, 3, 4]
+    assert sorted(d["product_id"] for d in db.dpps.docs.values()) == ["P-1", "P-5"]
+
+
+def test_batch_whose_write_context_fails_is_reported():
+    db = MemoryDatabase()
+    entered = []
+
+    @asynccontextmanager
+    async def context(docs):
+        entered.append(len(entered))
+        if len(entered) == 2:
+            raise RuntimeError("no version reserved")
+        yield
+
+    body = b"\n".join(b'{"product_id": "P-%d"}' % i for i in range(1, 6))
+    report = run(bulk_insert(db.dpps, aiter_of(body), batch_size=2, max_in_flight=1, write_context=context))
+    assert report["received"] == 5
+    assert report["inserted"] == 3 and report["failed"] == 2
+    assert report["errors"] == [
+        {"line": 3, "error": "batch insert failed: no version reserved"},
+        {"line": 4, "error": "batch insert failed: no version reserved"},
+    ]
+    assert sorted(d["product_id"] for d in db.dpps.docs.values()) == ["P-1", "P-2", "P-5"]
@@ -0,0 +1,108 @@
+import json
+
+from conftest import run
+
+from extraction import ExtractionPipeline, merge_results
+from invoice_rules import TemplateRegistry, extract_fields, parse_date, to_dpp
+
+EMPTY = TemplateRegistry("/nonexistent")
+
+
+def fields(text, registry=EMPTY):
+    return extract_fields(text, registry).values
+
+
+def test_generic_labels():
+    values = fields(
+        "TAX INVOICE\nInvoice No: INV-2024/0042  Invoice Date: 05-Mar-2024\n"
+        "Qty: 1,200  Batch No: B-7781\nGrand Total: Rs. 12,500.50\nGSTIN: 27AAACA1234A1Z5"
+    )
+    assert values["invoice_details.invoice_number"] == "INV-2024/0042"
+    assert values["invoice_details.invoice_date"] == "2024-03-05"
+    assert values["invoice_details.quantity"] == 1200
+    assert values["invoice_details.price"] == 12500.5
+    assert values["invoice_details.currency"] == "INR"
+    assert values["batch_number"] == "B-7781"
+    assert values["supplier.gstin"] == "27AAACA1234A1Z5"
+
+
+def test_other_dates_are_not_taken_as_the_invoice_date():
+    values = fields("Mfg Date: 01/02/2024\nDue Date: 15/03/2024\nExpiry Date: 01/02/2026\nMfg. Date 02/02/2024")
+    assert "invoice_details.invoice_date" not in values
+    assert values["manufacture_date"] == "2024-02-01"
+    assert values["expiry_date"] == "2026-02-01"
+
+
+def test_bare_date_label_is_the_invoice_date():
+    assert fields("Invoice No: 4471  Date: 03/04/2024")["invoice_details.invoice_date"] == "2024-04-03"
+    assert fields("Due Date: 15/03/2024\nDated: 01/03/2024")["invoice_details.invoice_date"] == "2024-03-01"
+
+
+def test_invoice_number_must_be_upper_case_with_a_digit():
+    values = fields("Invoice No: dated 01/02/2024")
+    assert "invoice_details.invoice_number" not in values
+    assert values["invoice_details.invoice_date"] == "2024-02-01"
+    assert "invoice_details.invoice_number" not in fields("Invoice Number: PENDING")
+    assert fields("invoice no. 2024-118")["invoice_details.invoice_number"] == "2024-118"
+
+
+def test_parse_date():
+    assert parse_date("2024-3-5") == "2024-03-05"
+    assert parse_date("05/03/24") == "2024-03-05"
+    assert parse_date("5 March, 2024") == "2024-03-05"
+    assert parse_date("31/02/2024") is None
+
+
+def test_to_dpp_drops_only_what_does_not_validate():
+    dpp, rejected = to_dpp({
+        "product_name": "Widget",
+        "supplier.gstin": "27AAACA1234A1Z5",
+        "invoice_details.quantity": "ten",
+        "invoice_details.price": 10.5,
+    })
+    assert dpp.product_name == "Widget"
+    assert dpp.supplier is None
+    assert dpp.invoice_details.price == 10.5 and dpp.invoice_details.quantity is None
+    assert rejected == {"supplier": {"gstin": "27AAACA1234A1Z5"}, "invoice_details.quantity": "ten"}
+
+
+def test_template_fields_and_merge(tmp_path):
+    (tmp_path / "acme.json").write_text(json.dumps({
+        "name": "acme",
+        "match": {"gstin": ["27AAACA1234A1Z5"]},
+        "fields": {"invoice_details.invoice_number": "Bill Ref\\s*(\\S+)"},
+        "defaults": {"category": "Textiles"},
+        "required": ["supplier.name", "invoice_details.invoice_number"],
+    }))
+    rules = extract_fields("GSTIN 27AAACA1234A1Z5\nBill Ref acme/778\n", TemplateRegistry(str(tmp_path)))
+    assert rules.template["name"] == "acme"
+    assert rules.values["invoice_details.invoice_number"] == "acme/778"
+    assert rules.missing() == ["supplier.name"]
+
+    # The LLM is only asked for supplier.name; if it cannot find it the
+    # supplier block (and its GSTIN) is reported as rejected.
+    dpp_json, rejected = merge_results(rules, {"supplier.name": None}, rules.missing())
+    assert dpp_json == {"category": "Textiles", "invoice_details": {"invoice_number": "acme/778"}}
+    assert rejected == {"supplier": {"gstin": "27AAACA1234A1Z5"}}
+
+    dpp_json, rejected = merge_results(rules, {"supplier": {"name": "Acme"}}, rules.missing())
+    assert dpp_json["supplier"] == {"name": "Acme", "gstin": "27AAACA1234A1Z5"}
+    assert rejected == {}
+
+
+def test_template_with_everything_found_skips_the_llm(tmp_path, monkeypatch):
+    (tmp_path / "acme.json").write_text(json.dumps({
+        "match": {"pattern": "ACME"},
+        "defaults": {"supplier.name": "Acme"},
+        "required": ["supplier.name"],
+    }))
+    monkeypatch.setattr("extraction.extract_fields", lambda text: extract_fields(text, TemplateRegistry(str(tmp_path))))
+
+    class NoLLM:
+        async def complete(self, prompt, model):
+            raise AssertionError("LLM should not be called")
+
+    result = run(ExtractionPipeline(llm=NoLLM()).extract("ACME invoice"))
+    assert result["llm_fields"] == []
+    assert result["dpp_json"] == {"supplier": {"name": "Acme"}}
+    assert result["rejected"] == {}
@@ -0,0 +1,66 @@
+import logging
+from types import SimpleNamespace
+
+from bson.objectid import ObjectId
+from conftest import call, run
+
+from metrics import CommandListener, Histogram, http_request_duration, mongo_command_duration, query_shape, registry
+
+
+def test_histogram_renders_cumulative_buckets():
+    h = Histogram("latency_seconds", "Latency.", ["route"], buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        h.observe(("/a",), value)
+    assert h.render() == [
+        "# HELP latency_seconds Latency.",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{route="/a",le="0.1"} 2',
+        'latency_seconds_bucket{route="/a",le="1.0"} 3',
+        'latency_seconds_bucket{route="/a",le="+Inf"} 4',
+        'latency_seconds_sum{route="/a"} 3.65',
+        'latency_seconds_count{route="/a"} 4',
+    ]
+
+
+def test_requests_are_labelled_by_route_template(db):
+    dpp_id = str(run(db.dpps.insert_one({"product_id": "P-1"})).inserted_id)
+    missing = str(ObjectId())
+    assert call("GET", f"/dpp/{dpp_id}").status_code == 200
+    assert call("GET", f"/dpp/{missing}").status_code == 404
+    assert ("GET", "/dpp/{dpp_id}", "200") in http_request_duration.series
+    assert ("GET", "/dpp/{dpp_id}", "404") in http_request_duration.series
+
+    text = call("GET", "/metrics").text
+    assert 'route="/dpp/{dpp_id}"' in text
+    assert dpp_id not in text and missing not in text
+
+
+def test_query_shape_hides_literals():
+    shape = query_shape({"category": "Apparel", "_id": {"$lt": ObjectId()}, "tags": {"$in": ["a", "b", "c", "d"]}})
+    assert shape == {"category": "str", "_id": {"$lt": "ObjectId"}, "tags": {"$in": ["str", "str", "str"]}}
+
+
+def command_event(name, command=None, duration_ms=None, request_id=1):
+    event = SimpleNamespace(command_name=name, connection_id=("db", 27017), request_id=request_id)
+    if command is not None:
+        event.command = command
+    if duration_ms is not None:
+        event.duration_micros = int(duration_ms * 1000)
+    return event
+
+
+def test_slow_commands_are_logged_with_their_filter_shape(caplog):
+    listener = CommandListener(slow_ms=50)
+    caplog.set_level(logging.WARNING, logger="metrics")
+
+    listener.started(command_event("find", {"find": "dpps", "filter": {"product_id": "P-1"}}, request_id=1))
+    listener.succeeded(command_event("find", duration_ms=5, request_id=1))
+    assert not caplog.records
+
+    listener.started(command_event("find", {"find": "dpps", "filter": {"category": "Apparel"}}, request_id=2))
+    listener.succeeded(command_event("find", duration_ms=120, request_id=2))
+    [record] = caplog.records
+    assert record.getMessage() == "Slow Mongo command find on dpps took 120.0 ms, filter shape {'category': 'str'}"
+    assert "Apparel" not in record.getMessage()
+    assert ("find", "dpps") in mongo_command_duration.series
+    assert registry.render().count('mongo_command_duration_seconds_count{command="find",collection="dpps"}') == 1
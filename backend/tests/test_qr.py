@@ -0,0 +1,111 @@
+import io
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from bson.objectid import ObjectId
+from conftest import call, run
+
+import main
+import qr
+from qr import QROptions, QRService, cache_path, dpp_url, prune_cache, touch
+
+
+def write(path, size, atime):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    os.utime(path, (atime, atime))
+
+
+def test_prune_removes_least_recently_used_first(tmp_path):
+    for i in range(10):
+        write(str(tmp_path / "ab" / f"{i}.png"), 100, 1000 + i)
+    write(str(tmp_path / "ab" / "9.png.123.tmp"), 100, 0)
+    assert prune_cache(str(tmp_path), 1000) == 0
+
+    assert prune_cache(str(tmp_path), 500) == 6
+    assert sorted(os.listdir(tmp_path / "ab")) == ["6.png", "7.png", "8.png", "9.png", "9.png.123.tmp"]
+
+
+def test_touch_marks_cached_files_as_used(tmp_path):
+    path = str(tmp_path / "a.png")
+    assert not touch(path)
+    write(path, 10, 1000)
+    assert touch(path)
+    assert os.stat(path).st_atime > 1000
+
+
+def test_qr_for_unknown_dpp_is_a_404(db):
+    assert call("GET", f"/dpp/{ObjectId()}/qr").status_code == 404
+    assert call("GET", "/dpp/nope/qr").status_code == 400
+
+
+def test_batch_rejects_unknown_ids(db):
+    known = str(run(db.dpps.insert_one({"product_id": "P-1"})).inserted_id)
+    unknown = str(ObjectId())
+    resp = call("POST", "/qr/batch", json={"ids": [known, unknown]})
+    assert resp.status_code == 404
+    assert unknown in resp.json()["detail"] and known not in resp.json()["detail"]
+
+
+class CountingPool(ThreadPoolExecutor):
+    """Thread-pool stand-in for the render process pool that counts submitted jobs."""
+
+    def __init__(self):
+        super().__init__(max_workers=2)
+        self.jobs = 0
+
+    def submit(self, fn, *args, **kwargs):
+        self.jobs += 1
+        return super().submit(fn, *args, **kwargs)
+
+
+@pytest.fixture
+def qr_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(qr, "QR_CACHE_DIR", str(tmp_path))
+    service = QRService(workers=2)
+    service._pool = CountingPool()
+    monkeypatch.setattr(main, "qr_service", service)
+    yield service
+    service.shutdown()
+
+
+def test_qr_is_rendered_once_then_served_from_the_cache(db, qr_cache):
+    dpp_id = str(run(db.dpps.insert_one({"product_id": "P-1"})).inserted_id)
+    first = call("GET", f"/dpp/{dpp_id}/qr")
+    assert first.status_code == 200
+    assert first.headers["content-type"] == "image/png"
+    assert first.content.startswith(b"\x89PNG")
+    assert qr_cache.pool.jobs == 1
+    path = cache_path(dpp_url(dpp_id), QROptions("png", 10, 4, "M"))
+    assert os.path.exists(path)
+
+    second = call("GET", f"/dpp/{dpp_id}/qr")
+    assert second.content == first.content
+    assert qr_cache.pool.jobs == 1
+
+    svg = call("GET", f"/dpp/{dpp_id}/qr", params={"format": "svg", "box_size": 5})
+    assert svg.headers["content-type"] == "image/svg+xml"
+    assert b"<svg" in svg.content
+    assert qr_cache.pool.jobs == 2
+
+
+def test_batch_zip_contains_every_code(db, qr_cache):
+    ids = [str(run(db.dpps.insert_one({"product_id": f"P-{i}"})).inserted_id) for i in range(5)]
+    single = call("GET", f"/dpp/{ids[0]}/qr", params={"box_size": 3})
+    jobs = qr_cache.pool.jobs
+
+    resp = call("POST", "/qr/batch", params={"zip": "true"}, json={"ids": ids, "box_size": 3})
+    assert resp.status_code == 200
+    assert resp.headers["content-type"] == "application/zip"
+    with zipfile.ZipFile(io.BytesIO(resp.content)) as archive:
+        assert archive.namelist() == [f"{i}.png" for i in ids]
+        assert archive.read(f"{ids[0]}.png") == single.content
+        assert all(archive.read(name).startswith(b"\x89PNG") for name in archive.namelist())
+    # Only the four codes that were not cached yet went to the pool, one per chunk.
+    assert qr_cache.pool.jobs == jobs + 4
+
+    call("POST", "/qr/batch", params={"zip": "true"}, json={"ids": ids, "box_size": 3})
+    assert qr_cache.pool.jobs == jobs + 4
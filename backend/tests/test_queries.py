@@ -0,0 +1,82 @@
+import pytest
+from bson.objectid import ObjectId
+from conftest import call, run
+
+from queries import QueryError, build_filter, build_projection, decode_cursor, encode_cursor
+
+
+def seed(db, n):
+    docs = [
+        {"product_id": f"P-{i:03d}", "category": "Apparel" if i % 2 else "Footwear", "supplier": {"name": f"S{i % 3}"}}
+        for i in range(n)
+    ]
+    run(db.dpps.insert_many(docs))
+    return docs
+
+
+def walk(params):
+    """Every page of GET /dpp, following X-Next-Cursor."""
+    pages = []
+    cursor = None
+    while True:
+        resp = call("GET", "/dpp", params={**params, **({"cursor": cursor} if cursor else {})})
+        assert resp.status_code == 200
+        pages.append(resp.json())
+        cursor = resp.headers.get("X-Next-Cursor")
+        if not cursor:
+            return pages
+
+
+def test_cursor_round_trip():
+    oid = ObjectId()
+    assert decode_cursor(encode_cursor(oid)) == oid
+    with pytest.raises(QueryError):
+        decode_cursor("not-a-cursor")
+
+
+def test_build_filter_maps_params_and_skips_unset():
+    assert build_filter({"category": "Apparel", "supplier_name": "S1", "product_id": None}) == {
+        "category": "Apparel", "supplier.name": "S1",
+    }
+
+
+def test_build_projection():
+    assert build_projection("product_id, supplier.name,id") == {"product_id": 1, "supplier.name": 1}
+    assert build_projection("id") == {"_id": 1}
+    with pytest.raises(QueryError):
+        build_projection("password")
+    with pytest.raises(QueryError):
+        build_projection("product_id.x")
+
+
+def test_keyset_pages_cover_everything_once_newest_first(db):
+    docs = seed(db, 23)
+    pages = walk({"limit": 10})
+    assert [len(p) for p in pages] == [10, 10, 3]
+    ids = [d["id"] for page in pages for d in page]
+    assert ids == [str(d["_id"]) for d in reversed(docs)]
+
+
+def test_exact_multiple_of_limit_has_no_empty_last_page(db):
+    seed(db, 20)
+    assert [len(p) for p in walk({"limit": 10})] == [10, 10]
+
+
+def test_pages_are_stable_when_newer_documents_arrive(db):
+    docs = seed(db, 15)
+    first = call("GET", "/dpp", params={"limit": 10})
+    run(db.dpps.insert_one({"product_id": "P-new"}))
+    second = call("GET", "/dpp", params={"limit": 10, "cursor": first.headers["X-Next-Cursor"]})
+    assert [d["id"] for d in second.json()] == [str(d["_id"]) for d in reversed(docs[:5])]
+
+
+def test_filters_and_projection_apply_to_every_page(db):
+    seed(db, 30)
+    pages = walk({"limit": 4, "category": "Apparel", "supplier_name": "S1", "fields": "product_id"})
+    items = [d for page in pages for d in page]
+    assert [d["product_id"] for d in items] == ["P-025", "P-019", "P-013", "P-007", "P-001"]
+    assert all(set(d) == {"id", "product_id"} for d in items)
+
+
+def test_bad_cursor_is_a_400(db):
+    assert call("GET", "/dpp", params={"cursor": "!!"}).status_code == 400
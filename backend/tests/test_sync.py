@@ -0,0 +1,157 @@
+import csv
+import gzip
+import io
+import json
+from datetime import timedelta
+
+import pytest
+from conftest import aiter_of, call, run
+
+import sync
+from ingest import bulk_insert
+from sync import TokenError, changes_since, decode_token, encode_token, versioned
+
+
+def changes(since=None, **params):
+    resp = call("GET", "/dpp/changes", params={**({"since": since} if since else {}), **params})
+    assert resp.status_code == 200
+    return resp.json()
+
+
+def create(product_id):
+    return call("POST", "/dpp", json={"product_id": product_id}).json()["id"]
+
+
+def test_token_round_trip():
+    assert decode_token(encode_token(42)) == 42
+    assert decode_token(None) == 0
+    with pytest.raises(TokenError):
+        decode_token("garbage!")
+    assert call("GET", "/dpp/changes", params={"since": "garbage!"}).status_code == 400
+
+
+def test_creates_updates_and_deletes_come_through_in_order(db):
+    a, b = create("A"), create("B")
+    batch = changes()
+    assert [d["id"] for d in batch["changed"]] == [a, b]
+    assert not (batch["has_more"] or batch["settling"])
+    token = batch["next"]
+    assert changes(token)["changed"] == []
+
+    call("PUT", f"/dpp/{a}", json={"product_id": "A2"})
+    call("DELETE", f"/dpp/{b}")
+    batch = changes(token)
+    assert [d["product_id"] for d in batch["changed"]] == ["A2"]
+    assert batch["deleted"] == [b]
+    assert batch["changed"][0]["version"] > decode_token(token)
+    # A full sync no longer shows the deleted DPP as changed.
+    assert [d["id"] for d in changes()["changed"]] == [a]
+
+
+def test_delete_holds_the_feed_until_its_tombstone_is_written(db, monkeypatch):
+    b = create("B")
+    token = changes()["next"]
+    write_tombstone = db.dpp_tombstones.update_one
+    held = []
+
+    async def observed(*args, **kwargs):
+        # B is already gone here; the feed must not move past it yet.
+        held.append((await changes_since(db, decode_token(token)), await sync.latest_token(db)))
+        return await write_tombstone(*args, **kwargs)
+
+    monkeypatch.setattr(db.dpp_tombstones, "update_one", observed)
+    assert call("DELETE", f"/dpp/{b}").status_code == 200
+    feed, latest = held[0]
+    assert feed["deleted"] == [] and feed["next"] == token and latest == token
+    assert changes(token)["deleted"] == [b]
+
+    assert call("DELETE", f"/dpp/{b}").status_code == 404
+    assert len(held) == 1
+    assert run(db.counters.find_one({"_id": sync.VERSION_COUNTER}))["pending"] == []
+
+
+def test_paging(db):
+    ids = [create(f"P-{i}") for i in range(7)]
+    seen, token, pages = [], None, 0
+    while True:
+        batch = changes(token, limit=3)
+        seen += [d["id"] for d in batch["changed"]]
+        token = batch["next"]
+        pages += 1
+        if not batch["has_more"]:
+            break
+    assert seen == ids
+    assert pages == 3
+
+
+def test_feed_stops_below_a_write_still_in_flight(db):
+    async def scenario():
+        slow = {"product_id": "slow"}
+        async with versioned(db, [slow]):
+            # A later write lands while the first one is still being written.
+            fast = {"product_id": "fast"}
+            async with versioned(db, [fast]):
+                await db.dpps.insert_one(fast)
+            held = await changes_since(db, 0)
+            await db.dpps.insert_one(slow)
+        released = await changes_since(db, 0)
+        return held, released
+
+    held, released = run(scenario())
+    assert held["changed"] == [] and held["settling"]
+    assert held["next"] == encode_token(0)
+    assert [d["product_id"] for d in released["changed"]] == ["slow", "fast"]
+    assert not released["settling"]
+
+
+def test_abandoned_reservations_stop_holding_the_feed_back(db, monkeypatch):
+    async def scenario():
+        crashed = versioned(db, [{}])
+        await crashed.__aenter__()  # never exits, like a worker that died mid-write
+        after = {"product_id": "after"}
+        async with versioned(db, [after]):
+            await db.dpps.insert_one(after)
+        held = await changes_since(db, 0)
+        monkeypatch.setattr(sync, "utcnow", lambda: sync.datetime.now(sync.timezone.utc) + timedelta(hours=1))
+        expired = await changes_since(db, 0)
+        await sync.expire_leases(db)
+        return held, expired, await db.counters.find_one({"_id": sync.VERSION_COUNTER})
+
+    held, expired, counter = run(scenario())
+    assert held["settling"] and held["changed"] == []
+    assert [d["product_id"] for d in expired["changed"]] == ["after"]
+    assert counter["pending"] == []
+
+
+def test_latest_token_skips_history(db):
+    create("old")
+    token = call("GET", "/dpp/changes/latest").json()["next"]
+    new = create("new")
+    assert [d["id"] for d in changes(token)["changed"]] == [new]
+
+
+def test_bulk_insert_versions_every_document(db):
+    body = b"\n".join(json.dumps({"product_id": f"P-{i}"}).encode() for i in range(5))
+    report = run(bulk_insert(
+        db.dpps, aiter_of(body), batch_size=2, write_context=lambda docs: versioned(db, docs),
+    ))
+    assert report["inserted"] == 5
+    versions = sorted(d["version"] for d in db.dpps.docs.values())
+    assert versions == [1, 2, 3, 4, 5]
+    assert run(db.counters.find_one({"_id": sync.VERSION_COUNTER}))["pending"] == []
+
+
+def test_export_includes_version_and_iso_timestamps(db):
+    dpp_id = create("P-1")
+    record = call("GET", f"/dpp/{dpp_id}").json()
+
+    line = json.loads(call("GET", "/dpp/export").text)
+    assert line["updated_at"] == record["updated_at"]
+    assert line["version"] == record["version"]
+
+    rows = list(csv.DictReader(io.StringIO(call("GET", "/dpp/export", params={"format": "csv"}).text)))
+    assert rows[0]["updated_at"] == record["updated_at"]
+    assert rows[0]["version"] == str(record["version"])
+
+    gz = call("GET", "/dpp/export", params={"compress": "true"}).content
+    assert json.loads(gzip.decompress(gz))["id"] == dpp_id
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from "react";
+import React, { useState, useEffect, useRef } from "react";
 import axios from "axios";
 
 function App() {
@@ -8,12 +8,44 @@ function App() {
   const [editId, setEditId] = useState(null);
 
   const apiUrl = "http://127.0.0.1:8000/dpp";
+  const syncToken = useRef(null);
 
-  // Fetch all DPPs
-  const fetchDpps = async () => {
+  // Newest change first
+  const byUpdated = (a, b) => (b.updated_at || "").localeCompare(a.updated_at || "");
+
+  // First load: the 50 newest DPPs. The sync token is taken before the
+  // list so nothing written in between is missed by later syncs.
+  const loadDpps = async () => {
     try {
-      const res = await axios.get(apiUrl);
-      setDpps(res.data || []);
+      const token = await axios.get(`${apiUrl}/changes/latest`);
+      const res = await axios.get(apiUrl, { params: { limit: 50 } });
+      syncToken.current = token.data.next;
+      setDpps([...res.data].sort(byUpdated));
+      setMessage("Backend Connected ✅");
+    } catch {
+      setMessage("❌ Cannot connect to backend");
+    }
+  };
+
+  // Sync DPPs: fetch only what changed since the last sync token
+  const syncDpps = async () => {
+    if (!syncToken.current) return loadDpps();
+    try {
+      let more = true;
+      while (more) {
+        const res = await axios.get(`${apiUrl}/changes`, { params: { since: syncToken.current } });
+        const { changed, deleted, next, has_more, settling } = res.data;
+        syncToken.current = next;
+        more = has_more;
+        setDpps((prev) => {
+          const byId = new Map(prev.map((d) => [d.id, d]));
+          deleted.forEach((id) => byId.delete(id));
+          changed.forEach((d) => byId.set(d.id, d));
+          return [...byId.values()].sort(byUpdated);
+        });
+        // Another write is still landing; look again shortly
+        if (settling) setTimeout(syncDpps, 500);
+      }
       setMessage("Backend Connected ✅");
     } catch {
       setMessage("❌ Cannot connect to backend");
@@ -31,7 +63,7 @@ function App() {
         await axios.post(apiUrl, form);
       }
       setForm({ name: "", category: "", status: "" });
-      fetchDpps();
+      syncDpps();
     } catch {
       setMessage("❌ Failed to save DPP");
     }
@@ -41,7 +73,7 @@ function App() {
   const deleteDpp = async (id) => {
     try {
       await axios.delete(`${apiUrl}/${id}`);
-      fetchDpps();
+      syncDpps();
     } catch {
       alert("❌ Failed to delete DPP");
     }
@@ -54,7 +86,7 @@ function App() {
   };
 
   useEffect(() => {
-    fetchDpps();
+    loadDpps();
   }, []);
 
   return (